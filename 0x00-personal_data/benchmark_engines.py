@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+"""
+This module benchmarks the regex and token redaction engines against each
+other while the number of redacted fields grows, to locate the field count
+from which the token engine is faster (TOKEN_ENGINE_MIN_FIELDS).
+
+Usage:
+    ./benchmark_engines.py [--messages 2000] [--repeat 5]
+"""
+
+import argparse
+import random
+import string
+import timeit
+from typing import List, Tuple
+
+from filtered_logger import RedactionPlan, TokenRedactionPlan
+
+FIELD_COUNTS: Tuple[int, ...] = (1, 2, 5, 10, 20, 30, 50, 100, 200, 500)
+
+
+def make_fields(count: int, seed: int = 0) -> List[str]:
+    """
+    Generates distinct field names of 4 to 12 lowercase letters.
+
+    Args:
+        count (int): Number of field names.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        List[str]: The field names.
+    """
+    rng = random.Random(seed)
+    fields = set()
+    while len(fields) < count:
+        fields.add("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 12))))
+    return sorted(fields)
+
+
+def make_messages(fields: List[str], count: int, seed: int = 0) -> List[str]:
+    """
+    Generates log lines mixing redacted and plain fields.
+
+    Args:
+        fields (List[str]): The redacted field names.
+        count (int): Number of log lines.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        List[str]: The log lines.
+    """
+    rng = random.Random(seed)
+    plain = [f"attr_{i}" for i in range(10)] + ["user_id", "created_at", "last_login"]
+    messages = []
+    for _ in range(count):
+        parts = []
+        for _ in range(8):
+            name = rng.choice(fields) if rng.random() < 0.3 else rng.choice(plain)
+            parts.append(f"{name}={rng.randrange(10 ** 8)}")
+        messages.append(";".join(parts) + ";")
+    return messages
+
+
+def main() -> None:
+    """
+    Prints records/s of both engines for each field count, and the smallest
+    field count from which the token engine stays faster.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    crossover = None
+    print(f"{'fields':>6} {'regex rec/s':>14} {'token rec/s':>14}")
+    for count in FIELD_COUNTS:
+        fields = make_fields(count)
+        messages = make_messages(fields, args.messages)
+        regex_plan = RedactionPlan(fields, "***", ";")
+        token_plan = TokenRedactionPlan(fields, "***", ";")
+        assert regex_plan.filter_many(messages) == token_plan.filter_many(messages)
+        regex_time = min(timeit.repeat(lambda: regex_plan.filter_many(messages),
+                                       number=1, repeat=args.repeat))
+        token_time = min(timeit.repeat(lambda: token_plan.filter_many(messages),
+                                       number=1, repeat=args.repeat))
+        print(f"{count:>6} {args.messages / regex_time:>14.0f} {args.messages / token_time:>14.0f}")
+        if token_time >= regex_time:
+            crossover = None
+        elif crossover is None:
+            crossover = count
+    print(f"token engine faster from {crossover} fields" if crossover else "token engine never faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+"""
+This module provides a command line tool that redacts existing `key=value;`
+log files in parallel, with the same semantics as filter_datum applied to
+every line.
+
+The input file is memory-mapped and split into newline-aligned chunks that
+are redacted across a process pool; results are written in input order.
+
+Usage:
+    ./bulk_redact.py INPUT OUTPUT [--fields name,email] [--workers 8]
+"""
+
+import argparse
+import mmap
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Sequence, Tuple
+
+from filtered_logger import PII_FIELDS, RedactingFormatter, get_redaction_plan
+
+DEFAULT_CHUNK_SIZE = 16 * 1024 * 1024
+ENCODING = "utf-8"
+
+
+def chunk_offsets(mm: mmap.mmap, chunk_size: int) -> Iterator[Tuple[int, int]]:
+    """
+    Splits a mapped file into chunks that end right after a newline.
+
+    Args:
+        mm (mmap.mmap): The mapped input file.
+        chunk_size (int): Approximate size of each chunk in bytes.
+
+    Yields:
+        Tuple[int, int]: The (start, end) byte offsets of each chunk.
+    """
+    size = len(mm)
+    start = 0
+    while start < size:
+        end = mm.find(b"\n", min(start + chunk_size, size) - 1)
+        end = size if end == -1 else end + 1
+        yield start, end
+        start = end
+
+
+def redact_chunk(path: str, start: int, end: int, fields: Sequence[str],
+                 redaction: str, separator: str) -> bytes:
+    """
+    Redacts one chunk of the input file.
+
+    Runs in a worker process, which maps the file itself so only offsets and
+    the redacted output cross the process boundary.
+
+    Args:
+        path (str): Path of the input file.
+        start (int): Offset of the first byte of the chunk.
+        end (int): Offset one past the last byte of the chunk.
+        fields (Sequence[str]): Fields to obfuscate.
+        redaction (str): String used to replace field values.
+        separator (str): Character separating fields in a line.
+
+    Returns:
+        bytes: The redacted chunk.
+    """
+    plan = get_redaction_plan(fields, redaction, separator, multiline=True)
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        text = mm[start:end].decode(ENCODING, errors="surrogateescape")
+    return plan.filter(text).encode(ENCODING, errors="surrogateescape")
+
+
+def redact_file(input_path: str, output_path: str, fields: Sequence[str],
+                redaction: str, separator: str, workers: int,
+                chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Redacts a whole log file across a process pool.
+
+    At most two chunks per worker are in flight, so memory stays bounded
+    regardless of the input size.
+
+    Args:
+        input_path (str): Path of the log file to redact.
+        output_path (str): Path the redacted file is written to.
+        fields (Sequence[str]): Fields to obfuscate.
+        redaction (str): String used to replace field values.
+        separator (str): Character separating fields in a line.
+        workers (int): Number of worker processes.
+        chunk_size (int): Approximate size of each chunk in bytes.
+
+    Returns:
+        int: The number of input bytes processed.
+    """
+    size = os.path.getsize(input_path)
+    with open(output_path, "wb") as out:
+        if size == 0:
+            return 0
+        with open(input_path, "rb") as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+                ProcessPoolExecutor(max_workers=workers) as pool:
+            pending: deque = deque()
+            for start, end in chunk_offsets(mm, chunk_size):
+                pending.append(pool.submit(redact_chunk, input_path, start, end,
+                                           fields, redaction, separator))
+                if len(pending) >= 2 * workers:
+                    out.write(pending.popleft().result())
+            while pending:
+                out.write(pending.popleft().result())
+    return size
+
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    """
+    Parses the command line options.
+
+    Args:
+        argv (List[str]): Arguments to parse, defaults to sys.argv.
+
+    Returns:
+        argparse.Namespace: The parsed options.
+    """
+    parser = argparse.ArgumentParser(description="Redact PII fields in existing log files.")
+    parser.add_argument("input", help="log file to redact")
+    parser.add_argument("output", help="path of the redacted copy")
+    parser.add_argument("--fields", default=",".join(PII_FIELDS),
+                        help="comma separated fields to redact (default: %(default)s)")
+    parser.add_argument("--redaction", default=RedactingFormatter.REDACTION,
+                        help="replacement for field values (default: %(default)s)")
+    parser.add_argument("--separator", default=RedactingFormatter.SEPARATOR,
+                        help="field separator (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="worker processes (default: %(default)s)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="approximate chunk size in bytes (default: %(default)s)")
+    return parser.parse_args(argv)
+
+
+def main() -> None:
+    """
+    Redacts the input file and reports throughput on stderr.
+    """
+    args = parse_args()
+    fields = [field for field in args.fields.split(",") if field]
+    start = time.perf_counter()
+    size = redact_file(args.input, args.output, fields, args.redaction,
+                       args.separator, args.workers, args.chunk_size)
+    elapsed = time.perf_counter() - start
+    rate = size / (1024 * 1024) / elapsed if elapsed > 0 else 0.0
+    print(f"Redacted {size} bytes in {elapsed:.2f}s ({rate:.1f} MB/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
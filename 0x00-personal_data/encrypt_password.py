@@ -1,9 +1,21 @@
 #!/usr/bin/env python3
 """A module for encrypting and verifying passwords.
+
+Besides the one-at-a-time helpers, batch and asyncio variants spread bcrypt
+work over a thread pool; bcrypt releases the GIL while hashing, so batches
+scale with the available cores.
 """
 
+import asyncio
+import os
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Iterable, List, Optional, Tuple
+
 import bcrypt
 
+DEFAULT_CONCURRENCY = os.cpu_count() or 1
+
+
 def hash_password(password: str) -> bytes:
     """
     Hashes a password with a salt using bcrypt.
@@ -17,6 +29,7 @@ def hash_password(password: str) -> bytes:
     # Hash the password with a new salt
     return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
 
+
 def is_valid(hashed_password: bytes, password: str) -> bool:
     """
     Verifies if the provided password matches the hashed password.
@@ -30,3 +43,115 @@ def is_valid(hashed_password: bytes, password: str) -> bool:
     """
     # Check if the password matches the hashed password
     return bcrypt.checkpw(password.encode('utf-8'), hashed_password)
+
+
+def _check_pair(pair: Tuple[bytes, str]) -> bool:
+    """
+    Unpacks a (hashed_password, password) pair for is_valid.
+    """
+    return is_valid(*pair)
+
+
+def hash_passwords(passwords: Iterable[str],
+                   max_workers: Optional[int] = None) -> List[bytes]:
+    """
+    Hashes many passwords concurrently.
+
+    Args:
+        passwords (Iterable[str]): The plain text passwords to hash.
+        max_workers (Optional[int]): Number of hashing threads, defaults to
+            the number of CPUs.
+
+    Returns:
+        List[bytes]: The salted and hashed passwords, in input order.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers or DEFAULT_CONCURRENCY) as pool:
+        return list(pool.map(hash_password, passwords))
+
+
+def verify_many(pairs: Iterable[Tuple[bytes, str]],
+                max_workers: Optional[int] = None) -> List[bool]:
+    """
+    Verifies many passwords concurrently.
+
+    Args:
+        pairs (Iterable[Tuple[bytes, str]]): (hashed_password, password) pairs.
+        max_workers (Optional[int]): Number of checking threads, defaults to
+            the number of CPUs.
+
+    Returns:
+        List[bool]: For each pair, True if the password matches, in input order.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers or DEFAULT_CONCURRENCY) as pool:
+        return list(pool.map(_check_pair, pairs))
+
+
+async def hash_password_async(password: str,
+                              executor: Optional[Executor] = None) -> bytes:
+    """
+    Hashes a password without blocking the event loop.
+
+    Args:
+        password (str): The plain text password to hash.
+        executor (Optional[Executor]): Executor to run bcrypt on, defaults to
+            the loop's default executor.
+
+    Returns:
+        bytes: The salted and hashed password.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, hash_password, password)
+
+
+async def is_valid_async(hashed_password: bytes, password: str,
+                         executor: Optional[Executor] = None) -> bool:
+    """
+    Verifies a password without blocking the event loop.
+
+    Args:
+        hashed_password (bytes): The hashed password to check against.
+        password (str): The plain text password to verify.
+        executor (Optional[Executor]): Executor to run bcrypt on, defaults to
+            the loop's default executor.
+
+    Returns:
+        bool: True if the password matches, False otherwise.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, is_valid, hashed_password, password)
+
+
+async def hash_passwords_async(passwords: Iterable[str],
+                               max_workers: Optional[int] = None) -> List[bytes]:
+    """
+    Hashes many passwords concurrently without blocking the event loop.
+
+    Args:
+        passwords (Iterable[str]): The plain text passwords to hash.
+        max_workers (Optional[int]): Number of hashing threads, defaults to
+            the number of CPUs.
+
+    Returns:
+        List[bytes]: The salted and hashed passwords, in input order.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers or DEFAULT_CONCURRENCY) as pool:
+        return list(await asyncio.gather(
+            *(hash_password_async(password, pool) for password in passwords)))
+
+
+async def verify_many_async(pairs: Iterable[Tuple[bytes, str]],
+                            max_workers: Optional[int] = None) -> List[bool]:
+    """
+    Verifies many passwords concurrently without blocking the event loop.
+
+    Args:
+        pairs (Iterable[Tuple[bytes, str]]): (hashed_password, password) pairs.
+        max_workers (Optional[int]): Number of checking threads, defaults to
+            the number of CPUs.
+
+    Returns:
+        List[bool]: For each pair, True if the password matches, in input order.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers or DEFAULT_CONCURRENCY) as pool:
+        return list(await asyncio.gather(
+            *(is_valid_async(hashed, password, pool) for hashed, password in pairs)))
@@ -6,13 +6,359 @@ filter sensitive information from log messages, and log the database records
 in a redacted format.
 """
 
+import argparse
+import atexit
+import copy
+import json
+import multiprocessing
 import os
+import queue
 import re
+import sqlite3
+import sys
+import threading
+import time
 import logging
-from typing import List, Tuple
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import logging.handlers
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
 import mysql.connector
 from mysql.connector import connection, Error
 
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+
+REDACTION_PLAN_CACHE_SIZE = 128
+# Field count from which get_redaction_plan prefers TokenRedactionPlan, see benchmark_engines.py
+TOKEN_ENGINE_MIN_FIELDS = int(os.getenv("PERSONAL_DATA_TOKEN_ENGINE_MIN_FIELDS", "100"))
+
+
+class RedactionStats:
+    """
+    Thread-safe counters describing what redaction costs and which fields fire.
+
+    Filled by filter_datum, the filter_many batch APIs and
+    RedactingFormatter.format while instrumentation is enabled, see
+    enable_instrumentation.
+    """
+
+    def __init__(self):
+        """
+        Initialize empty counters.
+        """
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Sets every counter back to zero.
+        """
+        with self._lock:
+            self._field_hits: Dict[str, int] = {}
+            self._filter_calls = 0
+            self._filter_seconds = 0.0
+            self._records = 0
+            self._format_seconds = 0.0
+
+    def _add_hits(self, hits: Dict[str, int]) -> None:
+        """
+        Merges per-field hits; the caller holds the lock.
+        """
+        for field, count in hits.items():
+            self._field_hits[field] = self._field_hits.get(field, 0) + count
+
+    def add_filter(self, hits: Dict[str, int], seconds: float, calls: int = 1) -> None:
+        """
+        Records filter_datum calls, or the messages of a filter_many batch.
+
+        Args:
+            hits (Dict[str, int]): Fields redacted by the calls.
+            seconds (float): Time spent in the calls.
+            calls (int): Number of messages filtered.
+        """
+        with self._lock:
+            self._add_hits(hits)
+            self._filter_calls += calls
+            self._filter_seconds += seconds
+
+    def add_format(self, hits: Dict[str, int], seconds: float) -> None:
+        """
+        Records one formatted log record.
+
+        Args:
+            hits (Dict[str, int]): Fields redacted in the record.
+            seconds (float): Time spent formatting and redacting the record.
+        """
+        with self._lock:
+            self._add_hits(hits)
+            self._records += 1
+            self._format_seconds += seconds
+
+    def snapshot(self) -> Dict:
+        """
+        Returns a consistent copy of the counters.
+
+        Returns:
+            Dict: field_hits, filter_calls, filter_seconds, records,
+                format_seconds and format_us_per_record.
+        """
+        with self._lock:
+            return {
+                "field_hits": dict(self._field_hits),
+                "filter_calls": self._filter_calls,
+                "filter_seconds": self._filter_seconds,
+                "records": self._records,
+                "format_seconds": self._format_seconds,
+                "format_us_per_record": self._format_seconds / self._records * 1e6 if self._records else 0.0,
+            }
+
+
+_redaction_stats: Optional[RedactionStats] = None
+
+
+def enable_instrumentation() -> RedactionStats:
+    """
+    Starts collecting redaction statistics, process wide.
+
+    Returns:
+        RedactionStats: The collector, also returned by get_redaction_stats.
+    """
+    global _redaction_stats
+    if _redaction_stats is None:
+        _redaction_stats = RedactionStats()
+    return _redaction_stats
+
+
+def disable_instrumentation() -> None:
+    """
+    Stops collecting redaction statistics.
+    """
+    global _redaction_stats
+    _redaction_stats = None
+
+
+def get_redaction_stats() -> Optional[Dict]:
+    """
+    Returns a snapshot of the redaction statistics, or None when disabled.
+    """
+    stats = _redaction_stats
+    return stats.snapshot() if stats is not None else None
+
+
+class RedactionPlan:
+    """
+    A compiled, reusable redaction for one (fields, redaction, separator) triple.
+
+    Attributes:
+        fields (Tuple[str, ...]): The fields whose values are obfuscated.
+        redaction (str): The string substituted for each field value.
+        separator (str): The character separating fields in a log line.
+        multiline (bool): Whether values also stop at newlines, so a buffer of
+            many lines is redacted exactly as if each line were filtered alone.
+    """
+
+    def __init__(self, fields: Sequence[str], redaction: str, separator: str, multiline: bool = False):
+        """
+        Compile the field alternation and replacement template once.
+
+        Args:
+            fields (Sequence[str]): Fields to obfuscate.
+            redaction (str): String used to replace field values.
+            separator (str): Character separating fields in the log line.
+            multiline (bool): Stop values at newlines as well as at the separator.
+        """
+        self.fields = tuple(fields)
+        self.redaction = redaction
+        self.separator = separator
+        self.multiline = multiline
+        self._pattern = re.compile(r'({})=[^{}{}]*'.format(
+            '|'.join(re.escape(field) for field in self.fields), re.escape(separator),
+            r'\n' if multiline else ''))
+        # Backslashes are the only special characters in a re.sub template
+        self._replacement = r'\g<1>=' + redaction.replace('\\', '\\\\')
+
+    def filter(self, message: str, hits: Optional[Dict[str, int]] = None) -> str:
+        """
+        Redacts a single log line.
+
+        Args:
+            message (str): The log line.
+            hits (Optional[Dict[str, int]]): When given, incremented for each
+                redacted field (instrumentation, slower).
+
+        Returns:
+            str: The log line with obfuscated field values.
+        """
+        if hits is None:
+            return self._pattern.sub(self._replacement, message)
+
+        def count(match: re.Match) -> str:
+            field = match.group(1)
+            hits[field] = hits.get(field, 0) + 1
+            return match.expand(self._replacement)
+
+        return self._pattern.sub(count, message)
+
+    def filter_many(self, messages: Iterable[str]) -> List[str]:
+        """
+        Redacts a batch of log lines.
+
+        Args:
+            messages (Iterable[str]): The log lines.
+
+        Returns:
+            List[str]: The log lines with obfuscated field values, in order.
+        """
+        sub = self._pattern.sub
+        replacement = self._replacement
+        return [sub(replacement, message) for message in messages]
+
+
+class TokenRedactionPlan(RedactionPlan):
+    """
+    A redaction plan that tokenizes each message once instead of running the regex.
+
+    The message is split on the separator, and inside each segment every "="
+    is checked against a set of field names, trying only the field lengths that
+    exist. The cost no longer grows with the number of fields, and the output is
+    identical to RedactionPlan: in a segment, the first "=" preceded by a field
+    name is redacted, matching the longest such name (the leftmost regex match).
+    """
+
+    def __init__(self, fields: Sequence[str], redaction: str, separator: str, multiline: bool = False):
+        """
+        Precompute the field set and the distinct field lengths.
+
+        Args:
+            fields (Sequence[str]): Fields to obfuscate.
+            redaction (str): String used to replace field values.
+            separator (str): Character separating fields in the log line.
+            multiline (bool): Must be False; see supports().
+        """
+        if not self.supports(fields, separator, multiline):
+            raise ValueError("fields and separator are not supported by the token engine")
+        self.fields = tuple(fields)
+        self.redaction = redaction
+        self.separator = separator
+        self.multiline = multiline
+        self._field_set = frozenset(self.fields)
+        self._lengths = tuple(sorted({len(field) for field in self.fields}, reverse=True))
+
+    @staticmethod
+    def supports(fields: Sequence[str], separator: str, multiline: bool = False) -> bool:
+        """
+        Tells whether the token engine reproduces the regex output for these parameters.
+
+        Args:
+            fields (Sequence[str]): Fields to obfuscate.
+            separator (str): Character separating fields in the log line.
+            multiline (bool): Stop values at newlines as well as at the separator.
+
+        Returns:
+            bool: True if the fields are non-empty names free of "=" and of the
+                separator, and the separator is a single character other than "=".
+        """
+        if multiline or len(separator) != 1 or separator == '=' or not fields:
+            return False
+        return all(field and '=' not in field and separator not in field for field in fields)
+
+    def _redact_segment(self, segment: str, hits: Optional[Dict[str, int]] = None) -> str:
+        """
+        Redacts the value of the first field found in a separator-free segment.
+
+        Args:
+            segment (str): Text between two separators.
+            hits (Optional[Dict[str, int]]): Per-field counters to increment.
+
+        Returns:
+            str: The segment, with everything after the matched "=" replaced.
+        """
+        field_set = self._field_set
+        start = 0
+        while True:
+            equal = segment.find('=', start)
+            if equal == -1:
+                return segment
+            key = segment[start:equal]
+            field = key if key in field_set else None
+            if field is None:
+                for length in self._lengths:
+                    if length < len(key) and key[-length:] in field_set:
+                        field = key[-length:]
+                        break
+            if field is not None:
+                if hits is not None:
+                    hits[field] = hits.get(field, 0) + 1
+                return segment[:equal + 1] + self.redaction
+            start = equal + 1
+
+    def filter(self, message: str, hits: Optional[Dict[str, int]] = None) -> str:
+        """
+        Redacts a single log line.
+
+        Args:
+            message (str): The log line.
+            hits (Optional[Dict[str, int]]): When given, incremented for each
+                redacted field.
+
+        Returns:
+            str: The log line with obfuscated field values.
+        """
+        if '=' not in message:
+            return message
+        redact = self._redact_segment
+        separator = self.separator
+        return separator.join([redact(segment, hits) if '=' in segment else segment
+                               for segment in message.split(separator)])
+
+    def filter_many(self, messages: Iterable[str]) -> List[str]:
+        """
+        Redacts a batch of log lines.
+
+        Args:
+            messages (Iterable[str]): The log lines.
+
+        Returns:
+            List[str]: The log lines with obfuscated field values, in order.
+        """
+        return [self.filter(message) for message in messages]
+
+
+@lru_cache(maxsize=REDACTION_PLAN_CACHE_SIZE)
+def _cached_plan(fields: Tuple[str, ...], redaction: str, separator: str, multiline: bool) -> RedactionPlan:
+    """Builds the plan for a hashable key; see get_redaction_plan."""
+    if len(fields) >= TOKEN_ENGINE_MIN_FIELDS and TokenRedactionPlan.supports(fields, separator, multiline):
+        return TokenRedactionPlan(fields, redaction, separator, multiline)
+    return RedactionPlan(fields, redaction, separator, multiline)
+
+
+def get_redaction_plan(fields: Sequence[str], redaction: str, separator: str,
+                       multiline: bool = False) -> RedactionPlan:
+    """
+    Returns the compiled redaction plan for the given parameters.
+
+    Plans are kept in a bounded LRU cache keyed by (fields, redaction, separator),
+    so repeated calls with the same parameters do not recompile the regex.
+    From TOKEN_ENGINE_MIN_FIELDS fields on, a TokenRedactionPlan is returned
+    whenever it supports the parameters.
+
+    Args:
+        fields (Sequence[str]): Fields to obfuscate.
+        redaction (str): String used to replace field values.
+        separator (str): Character separating fields in the log line.
+        multiline (bool): Stop values at newlines as well as at the separator.
+
+    Returns:
+        RedactionPlan: The shared plan for these parameters.
+    """
+    return _cached_plan(tuple(fields), redaction, separator, multiline)
+
 
 def filter_datum(fields: List[str], redaction: str, message: str, separator: str) -> str:
     """
@@ -27,135 +373,1348 @@ def filter_datum(fields: List[str], redaction: str, message: str, separator: str
     Returns:
         str: The log message with obfuscated field values.
     """
-    return re.sub(
-        r'({})=[^{}]*'.format('|'.join(re.escape(field) for field in fields), re.escape(separator)),
-        lambda m: m.group(0).split('=')[0] + '=' + redaction,
-        message
-    )
+    stats = _redaction_stats
+    if stats is None:
+        return get_redaction_plan(fields, redaction, separator).filter(message)
+    hits: Dict[str, int] = {}
+    start = time.perf_counter()
+    redacted = get_redaction_plan(fields, redaction, separator).filter(message, hits)
+    stats.add_filter(hits, time.perf_counter() - start)
+    return redacted
+
+
+def filter_many(fields: List[str], redaction: str, messages: Iterable[str], separator: str) -> List[str]:
+    """
+    Applies filter_datum to a batch of log messages using one compiled plan.
+
+    Args:
+        fields (List[str]): List of strings representing all fields to obfuscate.
+        redaction (str): String representing by what the field will be obfuscated.
+        messages (Iterable[str]): The log lines.
+        separator (str): String representing by which character is separating all fields in the log line.
+
+    Returns:
+        List[str]: The log messages with obfuscated field values, in order.
+    """
+    return _filter_batch(get_redaction_plan(fields, redaction, separator), messages)
+
+
+def _filter_batch(plan: RedactionPlan, messages: Iterable[str]) -> List[str]:
+    """
+    Runs plan.filter_many, or counts hits and time message by message when
+    instrumentation is enabled.
+    """
+    stats = _redaction_stats
+    if stats is None:
+        return plan.filter_many(messages)
+    hits: Dict[str, int] = {}
+    start = time.perf_counter()
+    redacted = [plan.filter(message, hits) for message in messages]
+    stats.add_filter(hits, time.perf_counter() - start, len(redacted))
+    return redacted
+
+
+_JSON_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|[{}\[\]:,]|[^\s{}\[\]:,"]+')
+
+
+class JsonRedactionPlan:
+    """
+    Redacts PII values in JSON log lines in a single token scan.
+
+    Only the spans of redacted values are rewritten (with the redaction as a
+    JSON string); no object tree is built and the rest of the line, including
+    whitespace and key order, is kept byte for byte.
+
+    A field without a dot matches that key at any depth; a dotted field such
+    as "user.email" matches the key path, arrays being transparent, so it also
+    matches the suffix of a deeper path ("payload.user.email").
+
+    Attributes:
+        fields (Tuple[str, ...]): The fields whose values are obfuscated.
+        redaction (str): The string substituted for each field value.
+    """
+
+    def __init__(self, fields: Sequence[str], redaction: str):
+        """
+        Precompute the field lookups and the pre-check needles.
+
+        Args:
+            fields (Sequence[str]): Fields or dotted key paths to obfuscate.
+            redaction (str): String used to replace field values.
+        """
+        self.fields = tuple(fields)
+        self.redaction = redaction
+        self._field_set = frozenset(self.fields)
+        self._has_paths = any('.' in field for field in self.fields)
+        self._needles = tuple({'"{}"'.format(field.rsplit('.', 1)[-1]) for field in self.fields})
+        self._replacement = json.dumps(redaction)
+        self._key_pattern = re.compile(r'"({})"\s*:\s*'.format(
+            '|'.join(re.escape(field) for field in self.fields)))
+        self._decoder = json.JSONDecoder()
+
+    def _matches(self, path: List[str]) -> Optional[str]:
+        """
+        Returns the field named by the key path (innermost key last), if any.
+        """
+        if path[-1] in self._field_set:
+            return path[-1]
+        if self._has_paths:
+            for start in range(len(path) - 1):
+                dotted = '.'.join(path[start:])
+                if dotted in self._field_set:
+                    return dotted
+        return None
+
+    @staticmethod
+    def _skip_value(message: str, token: re.Match) -> int:
+        """
+        Returns the end offset of the value starting with `token`.
+        """
+        if token.group() not in ('{', '['):
+            return token.end()
+        depth = 0
+        while token is not None:
+            text = token.group()
+            if text in ('{', '['):
+                depth += 1
+            elif text in ('}', ']'):
+                depth -= 1
+                if depth == 0:
+                    return token.end()
+            token = _JSON_TOKEN.search(message, token.end())
+        return len(message)
+
+    def _filter_flat(self, message: str, hits: Optional[Dict[str, int]] = None) -> str:
+        """
+        Redacts a line free of backslashes when no field is a dotted path.
+
+        Without escapes, a quote opens or closes a string, so a key match lies
+        outside strings iff an even number of quotes precedes it; values are
+        then skipped with the C JSON decoder.
+        """
+        parts = []
+        copied = 0
+        position = 0
+        while True:
+            key = self._key_pattern.search(message, position)
+            if key is None:
+                break
+            position = key.end()
+            if message.count('"', copied, key.start()) % 2:
+                continue
+            try:
+                _, end = self._decoder.raw_decode(message, key.end())
+            except ValueError:
+                continue
+            if hits is not None:
+                hits[key.group(1)] = hits.get(key.group(1), 0) + 1
+            parts.append(message[copied:key.end()])
+            parts.append(self._replacement)
+            copied = position = end
+        if not parts:
+            return message
+        parts.append(message[copied:])
+        return ''.join(parts)
+
+    def filter(self, message: str, hits: Optional[Dict[str, int]] = None) -> str:
+        """
+        Redacts a single JSON log line.
+
+        Lines that mention none of the field names are returned unchanged
+        without being scanned.
+
+        Args:
+            message (str): The log line.
+            hits (Optional[Dict[str, int]]): When given, incremented for each
+                redacted field.
+
+        Returns:
+            str: The log line with obfuscated field values.
+        """
+        if '\\' not in message:
+            if not any(needle in message for needle in self._needles):
+                return message
+            if not self._has_paths:
+                return self._filter_flat(message, hits)
+        parts = []
+        copied = 0
+        # One entry per open container: the current key for objects, None for arrays
+        stack: List[Optional[str]] = []
+        is_object: List[bool] = []
+        expect_key = False
+        position = 0
+        while True:
+            token = _JSON_TOKEN.search(message, position)
+            if token is None:
+                break
+            text = token.group()
+            position = token.end()
+            if text == '{':
+                stack.append(None)
+                is_object.append(True)
+                expect_key = True
+            elif text == '[':
+                stack.append(None)
+                is_object.append(False)
+            elif text in ('}', ']'):
+                if stack:
+                    stack.pop()
+                    is_object.pop()
+                expect_key = False
+            elif text == ',':
+                expect_key = bool(is_object) and is_object[-1]
+            elif text == ':':
+                key = stack[-1] if stack else None
+                if key is None:
+                    continue
+                path = [k for k, obj in zip(stack, is_object) if obj and k is not None]
+                field = self._matches(path)
+                if field is None:
+                    continue
+                value = _JSON_TOKEN.search(message, position)
+                if value is None or value.group() in (',', '}', ']', ':'):
+                    continue
+                end = self._skip_value(message, value)
+                if hits is not None:
+                    hits[field] = hits.get(field, 0) + 1
+                parts.append(message[copied:value.start()])
+                parts.append(self._replacement)
+                copied = position = end
+            elif expect_key and text[0] == '"':
+                raw = text[1:-1]
+                stack[-1] = json.loads(text) if '\\' in raw else raw
+                expect_key = False
+        if not parts:
+            return message
+        parts.append(message[copied:])
+        return ''.join(parts)
+
+    def filter_many(self, messages: Iterable[str]) -> List[str]:
+        """
+        Redacts a batch of JSON log lines.
+
+        Args:
+            messages (Iterable[str]): The log lines.
+
+        Returns:
+            List[str]: The log lines with obfuscated field values, in order.
+        """
+        return [self.filter(message) for message in messages]
+
+
+@lru_cache(maxsize=REDACTION_PLAN_CACHE_SIZE)
+def _cached_json_plan(fields: Tuple[str, ...], redaction: str) -> JsonRedactionPlan:
+    """Builds the JSON plan for a hashable key; see get_json_redaction_plan."""
+    return JsonRedactionPlan(fields, redaction)
+
+
+def get_json_redaction_plan(fields: Sequence[str], redaction: str) -> JsonRedactionPlan:
+    """
+    Returns the cached JSON redaction plan for the given parameters.
+
+    Args:
+        fields (Sequence[str]): Fields or dotted key paths to obfuscate.
+        redaction (str): String used to replace field values.
+
+    Returns:
+        JsonRedactionPlan: The shared plan for these parameters.
+    """
+    return _cached_json_plan(tuple(fields), redaction)
+
+
+def filter_json(fields: List[str], redaction: str, message: str) -> str:
+    """
+    Replaces the values of certain keys in a JSON log line with a redaction string.
+
+    Args:
+        fields (List[str]): Keys, or dotted key paths, whose values are obfuscated.
+        redaction (str): String representing by what the values will be obfuscated.
+        message (str): A JSON document on one line.
+
+    Returns:
+        str: The log line with obfuscated values.
+    """
+    return get_json_redaction_plan(fields, redaction).filter(message)
 
 
 class RedactingFormatter(logging.Formatter):
     """
     Redacting Formatter class for logging.
 
+    Besides text messages, records may carry a mapping, either as the message
+    itself (`logger.info(row)`) or as `extra={"data": row}`. The mapping is
+    rendered as "key=value; key=value" with PII values replaced by key lookup
+    before the string is built, so no regex runs over the formatted line.
+
+    In JSON mode, messages that are JSON documents are redacted with a
+    JsonRedactionPlan instead of the key=value plan.
+
     Attributes:
         REDACTION (str): The redaction string to use for sensitive information.
         FORMAT (str): The log format string.
         SEPARATOR (str): The separator character for log fields.
+        DATA_ATTRIBUTE (str): Record attribute holding a mapping passed with extra=.
     """
 
     REDACTION = "***"
     FORMAT = "[HOLBERTON] %(name)s %(levelname)s %(asctime)-15s: %(message)s"
     SEPARATOR = ";"
+    DATA_ATTRIBUTE = "data"
+    _KEY_CACHE_SIZE = 1024
 
-    def __init__(self, fields: List[str]):
+    def __init__(self, fields: List[str], json_mode: bool = False):
         """
         Initialize the formatter with fields to redact.
 
         Args:
             fields (List[str]): List of fields to redact in log messages.
+            json_mode (bool): Redact JSON messages by key, see JsonRedactionPlan.
         """
         super(RedactingFormatter, self).__init__(self.FORMAT)
         self.fields = fields
+        self.json_mode = json_mode
+        self._plan = get_redaction_plan(fields, self.REDACTION, self.SEPARATOR)
+        self._json_plan = get_json_redaction_plan(fields, self.REDACTION) if json_mode else None
+        # "key=" segment prefix -> field redacting its value ("" if none)
+        self._head_fields: Dict[str, str] = {}
 
-    def format(self, record: logging.LogRecord) -> str:
+    def _head_field(self, head: str) -> str:
         """
-        Formats a log record, redacting specified fields.
+        Returns the field the text plan matches in `head`, or "" if none.
 
         Args:
-            record (logging.LogRecord): The log record to format.
+            head (str): A "key=" segment prefix without "=" or separator in the key.
 
         Returns:
-            str: The formatted log message with redacted fields.
+            str: The matched field name, empty if the key is not PII.
         """
-        original_message = super().format(record)
-        return filter_datum(self.fields, self.REDACTION, original_message, self.SEPARATOR)
+        field = self._head_fields.get(head)
+        if field is None:
+            if len(self._head_fields) >= self._KEY_CACHE_SIZE:
+                self._head_fields.clear()
+            hits: Dict[str, int] = {}
+            self._plan.filter(head, hits)
+            field = next(iter(hits), "")
+            self._head_fields[head] = field
+        return field
 
+    def redacts_key(self, key: str, first: bool = True) -> bool:
+        """
+        Tells whether every value logged under `key` is fully redacted.
 
-PII_FIELDS: Tuple[str, ...] = ("name", "email", "phone", "ssn", "password")
+        Args:
+            key (str): A mapping key or column name.
+            first (bool): Whether the key starts the message; later keys are
+                preceded by a space.
 
+        Returns:
+            bool: True if the key names a PII field. Keys containing "=" or
+                the separator are conservatively reported as not redacted.
+        """
+        if '=' in key or self.SEPARATOR in key:
+            return False
+        return bool(self._head_field(f"{key}=" if first else f" {key}="))
 
-def get_logger() -> logging.Logger:
-    """
-    Creates a logger named 'user_data' that logs up to INFO level and does not propagate messages to other loggers.
+    def redact_mapping(self, data: Mapping, hits: Optional[Dict[str, int]] = None) -> str:
+        """
+        Renders a mapping as a redacted "key=value; key=value" message.
 
-    Returns:
-        logging.Logger: Configured logger object.
-    """
-    logger = logging.getLogger("user_data")
-    logger.setLevel(logging.INFO)
-    logger.propagate = False
+        The result is the same as building the message first and filtering it
+        with filter_datum. Keys are classified once and cached; only segments
+        whose key or value contains "=" or the separator go through the regex.
 
-    stream_handler = logging.StreamHandler()
-    formatter = RedactingFormatter(fields=PII_FIELDS)
-    stream_handler.setFormatter(formatter)
-    logger.addHandler(stream_handler)
+        Args:
+            data (Mapping): The structured record, e.g. a database row.
+            hits (Optional[Dict[str, int]]): When given, incremented for each
+                redacted field.
 
-    return logger
+        Returns:
+            str: The redacted message.
+        """
+        separator = self.SEPARATOR
+        segments = []
+        for key, value in data.items():
+            head = f"{key}=" if not segments else f" {key}="
+            text = f"{value}"
+            if '=' in text or separator in text or separator in head or head.count('=') > 1:
+                segments.append(self._plan.filter(head + text, hits))
+                continue
+            field = self._head_field(head)
+            if field:
+                if hits is not None:
+                    hits[field] = hits.get(field, 0) + 1
+                segments.append(head + self.REDACTION)
+            else:
+                segments.append(head + text)
+        return separator.join(segments)
 
+    def _structured_data(self, record: logging.LogRecord) -> Optional[Mapping]:
+        """
+        Returns the mapping carried by a record, if any.
+        """
+        if isinstance(record.msg, Mapping) and not record.args:
+            return record.msg
+        data = getattr(record, self.DATA_ATTRIBUTE, None)
+        return data if isinstance(data, Mapping) else None
 
-def get_db() -> connection.MySQLConnection:
-    """
-    Connects to the MySQL database using credentials from environment variables.
+    def format(self, record: logging.LogRecord) -> str:
+        """
+        Formats a log record, redacting specified fields.
 
-    Returns:
-        mysql.connector.connection.MySQLConnection: A MySQLConnection object connected to the database.
-    """
-    # Retrieve database credentials from environment variables
-    db_username = os.getenv("PERSONAL_DATA_DB_USERNAME", "root")
-    db_password = os.getenv("PERSONAL_DATA_DB_PASSWORD", "")
-    db_host = os.getenv("PERSONAL_DATA_DB_HOST", "localhost")
-    db_name = os.getenv("PERSONAL_DATA_DB_NAME")
+        When instrumentation is enabled, field hits and the time spent
+        formatting are added to the shared RedactionStats.
 
-    if db_name is None:
-        raise ValueError("The environment variable PERSONAL_DATA_DB_NAME must be set.")
+        Args:
+            record (logging.LogRecord): The log record to format.
 
-    try:
-        # Connect to the MySQL database
-        connection = mysql.connector.connect(
-            user=db_username,
-            password=db_password,
-            host=db_host,
-            database=db_name
-        )
-        return connection
-    except Error as err:
-        raise RuntimeError(f"Error connecting to the database: {err}")
+        Returns:
+            str: The formatted log message with redacted fields.
+        """
+        stats = _redaction_stats
+        if stats is None:
+            return self._format(record, None)
+        hits: Dict[str, int] = {}
+        start = time.perf_counter()
+        formatted = self._format(record, hits)
+        stats.add_format(hits, time.perf_counter() - start)
+        return formatted
 
+    def _format(self, record: logging.LogRecord, hits: Optional[Dict[str, int]]) -> str:
+        """
+        Formats and redacts a record, counting hits when a dict is given.
+        """
+        data = self._structured_data(record)
+        if data is None and self._json_plan is not None:
+            text = record.getMessage()
+            if text.lstrip()[:1] in ('{', '['):
+                record = copy.copy(record)
+                record.msg = self._json_plan.filter(text, hits)
+                record.args = None
+                return super().format(record)
+        if data is None:
+            original_message = super().format(record)
+            return self._plan.filter(original_message, hits)
 
-def main() -> None:
-    """
-    Connects to the database, retrieves all rows from the users table, and displays each row under a filtered format.
-    """
-    try:
-        # Get database connection
-        db_connection = get_db()
+        # Format a copy so other handlers still see the original record
+        record = copy.copy(record)
+        message = self.redact_mapping(data, hits)
+        if data is not record.msg:
+            text = record.getMessage()
+            if text:
+                message = f"{self._plan.filter(text, hits)} {message}"
+        record.msg = message
+        record.args = None
+        return super().format(record)
 
-        cursor = db_connection.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM users")
-        rows = cursor.fetchall()
+    def filter_many(self, messages: Iterable[str]) -> List[str]:
+        """
+        Redacts a batch of already formatted log lines with this formatter's plan.
 
-        # Get the logger
-        logger = get_logger()
+        Args:
+            messages (Iterable[str]): The formatted log lines.
 
-        # Display each row in the specified format
-        for row in rows:
-            # Construct the log message
-            log_message = "; ".join(f"{key}={value}" for key, value in row.items())
-            logger.info(log_message)
+        Returns:
+            List[str]: The log lines with redacted fields, in order.
+        """
+        return _filter_batch(self._plan, messages)
 
-        # Print the filtered fields
-        print("Filtered fields:")
-        for field in PII_FIELDS:
-            print(field)
+
+PII_FIELDS: Tuple[str, ...] = ("name", "email", "phone", "ssn", "password")
+
+STREAM_BATCH_SIZE = int(os.getenv("PERSONAL_DATA_BATCH_SIZE", "1000"))
+
+
+OVERFLOW_POLICIES: Tuple[str, ...] = ("block", "drop", "sample")
+
+
+class RedactingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that hands records to a RedactingQueueListener.
+
+    Formatting and redaction are left to the listener's thread; the caller
+    only merges the message arguments and enqueues the record.
+
+    Attributes:
+        overflow (str): What to do when the queue is full: "block" waits for
+            room, "drop" discards the record, "sample" keeps one record out of
+            every `sample_every` overflowing ones and discards the rest.
+        sample_every (int): Sampling period of the "sample" policy.
+        dropped (int): Number of records discarded because the queue was full.
+    """
+
+    def __init__(self, log_queue: queue.Queue, overflow: str = "block", sample_every: int = 10):
+        """
+        Initialize the handler.
+
+        Args:
+            log_queue (queue.Queue): The bounded queue shared with the listener.
+            overflow (str): One of OVERFLOW_POLICIES.
+            sample_every (int): Sampling period of the "sample" policy.
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}, not {overflow!r}")
+        super().__init__(log_queue)
+        self.overflow = overflow
+        self.sample_every = max(1, sample_every)
+        self.dropped = 0
+        self._overflowed = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Merges the message arguments so the record is safe to format later.
+
+        Args:
+            record (logging.LogRecord): The record to enqueue.
+
+        Returns:
+            logging.LogRecord: A shallow copy carrying the final message.
+        """
+        record = copy.copy(record)
+        if isinstance(record.msg, Mapping) and not record.args:
+            # Structured records are rendered by RedactingFormatter on the listener
+            record.msg = dict(record.msg)
+        else:
+            record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """
+        Puts a record on the queue according to the overflow policy.
+
+        Args:
+            record (logging.LogRecord): The prepared record.
+        """
+        if self.overflow == "block":
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._overflowed += 1
+            if self.overflow == "sample" and self._overflowed % self.sample_every == 0:
+                self.queue.put(record)
+            else:
+                self.dropped += 1
+
+
+class RedactingQueueListener:
+    """
+    Background thread that formats, redacts and writes queued records in batches.
+
+    Attributes:
+        queue (queue.Queue): The queue fed by RedactingQueueHandler.
+        formatter (logging.Formatter): Formatter applied to each record.
+        stream: The text stream written to, stderr by default.
+        batch_size (int): Maximum number of records written per write call.
+    """
+
+    _SENTINEL = None
+
+    def __init__(self, log_queue: queue.Queue, formatter: logging.Formatter,
+                 stream=None, batch_size: int = 256):
+        """
+        Initialize the listener; call start() to begin consuming.
+
+        Args:
+            log_queue (queue.Queue): The queue fed by RedactingQueueHandler.
+            formatter (logging.Formatter): Formatter applied to each record.
+            stream: The text stream written to, stderr by default.
+            batch_size (int): Maximum number of records written per write call.
+        """
+        self.queue = log_queue
+        self.formatter = formatter
+        self.stream = stream if stream is not None else sys.stderr
+        # Reused for its terminator and error reporting; records bypass emit()
+        self._handler = logging.StreamHandler(self.stream)
+        self._handler.setFormatter(formatter)
+        self.batch_size = max(1, batch_size)
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """
+        Starts the background thread.
+        """
+        self._thread = threading.Thread(target=self._run, name="redacting-log-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Writes every record queued so far, then stops the background thread.
+        """
+        if self._thread is None:
+            return
+        self.queue.put(self._SENTINEL)
+        self._thread.join()
+        self._thread = None
+
+    def _write(self, records: List[logging.LogRecord]) -> None:
+        """
+        Formats a batch of records and writes it with a single call.
+
+        Args:
+            records (List[logging.LogRecord]): The records to write.
+        """
+        lines = []
+        for record in records:
+            try:
+                lines.append(self._handler.format(record) + self._handler.terminator)
+            except Exception:
+                self._handler.handleError(record)
+        if lines:
+            self.stream.write("".join(lines))
+            self.stream.flush()
+
+    def _run(self) -> None:
+        """
+        Consumes the queue until the sentinel is received.
+        """
+        while True:
+            record = self.queue.get()
+            batch = []
+            stopping = record is self._SENTINEL
+            if not stopping:
+                batch.append(record)
+            while not stopping and len(batch) < self.batch_size:
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is self._SENTINEL:
+                    stopping = True
+                else:
+                    batch.append(record)
+            self._write(batch)
+            if stopping:
+                return
+
+
+def get_logger(asynchronous: bool = False, queue_size: int = 10000,
+               overflow: str = "block") -> logging.Logger:
+    """
+    Creates a logger named 'user_data' that logs up to INFO level and does not propagate messages to other loggers.
+
+    Args:
+        asynchronous (bool): Format, redact and write records on a background
+            thread fed by a bounded queue instead of on the caller's thread.
+            Queued records are flushed when the interpreter exits.
+        queue_size (int): Capacity of the queue in asynchronous mode.
+        overflow (str): Policy applied when the queue is full, one of
+            OVERFLOW_POLICIES.
+
+    Returns:
+        logging.Logger: Configured logger object.
+    """
+    logger = logging.getLogger("user_data")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    formatter = RedactingFormatter(fields=PII_FIELDS)
+    if asynchronous:
+        log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        listener = RedactingQueueListener(log_queue, formatter)
+        listener.start()
+        atexit.register(listener.stop)
+        logger.addHandler(RedactingQueueHandler(log_queue, overflow=overflow))
+        return logger
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+    logger.addHandler(stream_handler)
+
+    return logger
+
+
+class DatabaseBackend:
+    """
+    Minimal DB-API abstraction the export relies on.
+
+    Subclasses open connections, hand out cursors returning rows as dicts and
+    tell whether an idle connection is still usable.
+    """
+
+    def connect(self):
+        """
+        Opens a new connection.
+        """
+        raise NotImplementedError
+
+    def dict_cursor(self, db_connection, buffered: bool = True):
+        """
+        Returns a cursor whose rows are dicts keyed by column name.
+
+        Args:
+            db_connection: A connection opened by this backend.
+            buffered (bool): Whether the whole result set may be fetched
+                client side at execute time.
+        """
+        raise NotImplementedError
+
+    def is_alive(self, db_connection) -> bool:
+        """
+        Tells whether a connection can still be used.
+
+        Args:
+            db_connection: A connection opened by this backend.
+        """
+        raise NotImplementedError
+
+    def quote_identifier(self, name: str) -> str:
+        """
+        Quotes a column or table name; backticks work for MySQL and SQLite.
+
+        Args:
+            name (str): The identifier.
+
+        Returns:
+            str: The quoted identifier.
+        """
+        return "`{}`".format(name.replace("`", "``"))
+
+    def quote_literal(self, value: str) -> str:
+        """
+        Quotes a constant string for inlining in SQL.
+
+        Args:
+            value (str): The string.
+
+        Returns:
+            str: The SQL string literal.
+        """
+        return "'{}'".format(value.replace("'", "''"))
+
+
+class MySQLBackend(DatabaseBackend):
+    """
+    MySQL backend built on mysql.connector.
+    """
+
+    def __init__(self, user: str, password: str, host: str, database: str):
+        """
+        Initialize the backend with connection credentials.
+
+        Args:
+            user (str): Database user.
+            password (str): Password of the user.
+            host (str): Database host.
+            database (str): Database name.
+        """
+        self.user = user
+        self.password = password
+        self.host = host
+        self.database = database
+
+    @classmethod
+    def from_env(cls) -> "MySQLBackend":
+        """
+        Builds the backend from the PERSONAL_DATA_DB_* environment variables.
+
+        Returns:
+            MySQLBackend: The configured backend.
+        """
+        db_name = os.getenv("PERSONAL_DATA_DB_NAME")
+        if db_name is None:
+            raise ValueError("The environment variable PERSONAL_DATA_DB_NAME must be set.")
+        return cls(
+            user=os.getenv("PERSONAL_DATA_DB_USERNAME", "root"),
+            password=os.getenv("PERSONAL_DATA_DB_PASSWORD", ""),
+            host=os.getenv("PERSONAL_DATA_DB_HOST", "localhost"),
+            database=db_name
+        )
+
+    def connect(self) -> connection.MySQLConnection:
+        """
+        Opens a new MySQL connection.
+
+        Returns:
+            mysql.connector.connection.MySQLConnection: The connection.
+        """
+        try:
+            return mysql.connector.connect(
+                user=self.user,
+                password=self.password,
+                host=self.host,
+                database=self.database
+            )
+        except Error as err:
+            raise RuntimeError(f"Error connecting to the database: {err}")
+
+    def dict_cursor(self, db_connection, buffered: bool = True):
+        """
+        Returns a dictionary cursor; unbuffered cursors stream from the server.
+        """
+        return db_connection.cursor(dictionary=True, buffered=buffered)
+
+    def is_alive(self, db_connection) -> bool:
+        """
+        Pings the server through the connection.
+        """
+        return db_connection.is_connected()
+
+    def quote_literal(self, value: str) -> str:
+        """
+        Quotes a constant string; MySQL also treats backslashes as escapes.
+        """
+        return super().quote_literal(value.replace("\\", "\\\\"))
+
+
+def _dict_row(cursor: sqlite3.Cursor, row: tuple) -> Dict:
+    """
+    sqlite3 row factory returning rows as dicts keyed by column name.
+    """
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+class SQLiteBackend(DatabaseBackend):
+    """
+    SQLite stand-in for the MySQL backend, used by tests and benchmarks.
+    """
+
+    def __init__(self, database: str):
+        """
+        Initialize the backend.
+
+        Args:
+            database (str): Path of the database file, or ":memory:".
+        """
+        self.database = database
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Opens a new SQLite connection returning rows as dicts.
+
+        Returns:
+            sqlite3.Connection: The connection.
+        """
+        db_connection = sqlite3.connect(self.database, check_same_thread=False)
+        db_connection.row_factory = _dict_row
+        return db_connection
+
+    def dict_cursor(self, db_connection, buffered: bool = True):
+        """
+        Returns a cursor; SQLite cursors always step through results lazily.
+        """
+        return db_connection.cursor()
+
+    def is_alive(self, db_connection) -> bool:
+        """
+        Runs a trivial query on the connection.
+        """
+        try:
+            db_connection.execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+
+def get_backend() -> DatabaseBackend:
+    """
+    Returns the backend selected by PERSONAL_DATA_DB_BACKEND ("mysql" or "sqlite").
+
+    The SQLite backend opens the file named by PERSONAL_DATA_DB_NAME.
+
+    Returns:
+        DatabaseBackend: The configured backend.
+    """
+    kind = os.getenv("PERSONAL_DATA_DB_BACKEND", "mysql")
+    if kind == "mysql":
+        return MySQLBackend.from_env()
+    if kind == "sqlite":
+        return SQLiteBackend(os.getenv("PERSONAL_DATA_DB_NAME", ":memory:"))
+    raise ValueError(f"Unknown database backend: {kind}")
+
+
+class ConnectionPool:
+    """
+    Bounded pool of reusable connections for one backend.
+
+    Attributes:
+        backend (DatabaseBackend): Backend opening the connections.
+        size (int): Maximum number of connections checked out at once.
+        health_check (bool): Whether idle connections are checked with
+            backend.is_alive() before being handed out again.
+    """
+
+    def __init__(self, backend: DatabaseBackend, size: int = 5, health_check: bool = True):
+        """
+        Initialize an empty pool; connections are opened on demand.
+
+        Args:
+            backend (DatabaseBackend): Backend opening the connections.
+            size (int): Maximum number of connections checked out at once.
+            health_check (bool): Check idle connections before reuse.
+        """
+        self.backend = backend
+        self.size = size
+        self.health_check = health_check
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _checkout(self):
+        """
+        Returns a healthy idle connection, or a new one if there is none.
+        """
+        while True:
+            try:
+                db_connection = self._idle.get_nowait()
+            except queue.Empty:
+                return self.backend.connect()
+            if not self.health_check or self.backend.is_alive(db_connection):
+                return db_connection
+            self._discard(db_connection)
+
+    @staticmethod
+    def _discard(db_connection) -> None:
+        """
+        Closes a connection, ignoring errors from already broken ones.
+        """
+        try:
+            db_connection.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self):
+        """
+        Checks a connection out for the duration of a with block.
+
+        Blocks while `size` connections are in use. The connection goes back
+        to the pool on success and is closed if the block raised.
+
+        Yields:
+            A DB-API connection.
+        """
+        self._slots.acquire()
+        try:
+            db_connection = self._checkout()
+            try:
+                yield db_connection
+            except BaseException:
+                self._discard(db_connection)
+                raise
+            self._idle.put(db_connection)
+        finally:
+            self._slots.release()
+
+    def acquire(self) -> "PooledConnection":
+        """
+        Checks a connection out until its close() method is called.
+
+        Blocks while `size` connections are in use, like connection().
+
+        Returns:
+            PooledConnection: The connection, returned to the pool by close().
+        """
+        self._slots.acquire()
+        try:
+            return PooledConnection(self, self._checkout())
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, db_connection) -> None:
+        """
+        Returns a connection checked out by acquire() to the pool.
+
+        Args:
+            db_connection: The DB-API connection wrapped by the PooledConnection.
+        """
+        self._idle.put(db_connection)
+        self._slots.release()
+
+    def close(self) -> None:
+        """
+        Closes every idle connection.
+        """
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+class PooledConnection:
+    """
+    Connection checked out of a ConnectionPool by acquire().
+
+    Behaves as the DB-API connection it wraps, except that close() hands the
+    connection back to the pool instead of closing it.
+    """
+
+    def __init__(self, pool: ConnectionPool, db_connection):
+        """
+        Wrap a checked out connection.
+
+        Args:
+            pool (ConnectionPool): Pool the connection goes back to.
+            db_connection: The DB-API connection.
+        """
+        self._pool = pool
+        self._connection = db_connection
+
+    def __getattr__(self, name: str):
+        """
+        Delegates to the wrapped connection.
+        """
+        if self._connection is None:
+            raise Error("Connection is closed")
+        return getattr(self._connection, name)
+
+    def close(self) -> None:
+        """
+        Returns the connection to the pool; later calls do nothing.
+        """
+        db_connection, self._connection = self._connection, None
+        if db_connection is not None:
+            self._pool.release(db_connection)
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Returns the process-wide connection pool, creating it on first use.
+
+    The pool uses get_backend() and holds PERSONAL_DATA_DB_POOL_SIZE
+    connections (5 by default).
+
+    Returns:
+        ConnectionPool: The shared pool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(get_backend(), int(os.getenv("PERSONAL_DATA_DB_POOL_SIZE", "5")))
+            atexit.register(_pool.close)
+        return _pool
+
+
+def get_db() -> PooledConnection:
+    """
+    Connects to the MySQL database using credentials from environment variables.
+
+    The connection comes from the shared pool (see get_pool), so callers
+    reuse connections across calls; closing it returns it to the pool.
+
+    Returns:
+        PooledConnection: A MySQLConnection, by default, checked out of the pool.
+    """
+    return get_pool().acquire()
+
+
+def iter_rows(cursor, batch_size: int = STREAM_BATCH_SIZE) -> Iterator[Dict]:
+    """
+    Yields rows from an executed cursor in fetchmany batches.
+
+    Only one batch is held in memory at a time, so the cursor should be
+    unbuffered for the whole table to never be materialized client side.
+
+    Args:
+        cursor: An executed DB-API cursor.
+        batch_size (int): Number of rows requested per fetchmany call.
+
+    Yields:
+        Dict: One row at a time.
+    """
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def row_to_message(row: Dict) -> str:
+    """
+    Builds the "key=value; key=value" log message for a database row.
+
+    Logging the row itself instead lets RedactingFormatter redact it by key.
+
+    Args:
+        row (Dict): A row mapping column names to values.
+
+    Returns:
+        str: The log message for the row.
+    """
+    return "; ".join(f"{key}={value}" for key, value in row.items())
+
+
+def peak_rss_kib() -> int:
+    """
+    Returns the peak resident set size of this process in KiB, or 0 if unknown.
+    """
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in KiB elsewhere
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+USERS_QUERY = "SELECT * FROM users"
+
+
+def masked_users_query(cursor, backend: DatabaseBackend, fields: Sequence[str] = PII_FIELDS) -> str:
+    """
+    Builds a users query that replaces PII columns by the redaction constant in SQL.
+
+    Columns are read from the table and kept in order; a column is masked when
+    RedactingFormatter would redact its value, so PII never leaves the database.
+    Logging the rows gives the same lines, except for values containing the
+    separator: the formatter only redacts up to the separator (email="a;b" is
+    logged as email=***;b) while the masked column hides the whole value, the
+    stricter redaction.
+
+    Args:
+        cursor: A dictionary cursor used to read the column names.
+        backend (DatabaseBackend): Backend used to quote names and literals.
+        fields (Sequence[str]): Fields to redact.
+
+    Returns:
+        str: The SELECT statement.
+    """
+    cursor.execute("SELECT * FROM users LIMIT 0")
+    columns = [column[0] for column in cursor.description]
+    cursor.fetchall()
+    formatter = RedactingFormatter(fields=fields)
+    redaction = backend.quote_literal(formatter.REDACTION)
+    selected = []
+    for position, column in enumerate(columns):
+        quoted = backend.quote_identifier(column)
+        if formatter.redacts_key(column, first=position == 0):
+            selected.append(f"{redaction} AS {quoted}")
+        else:
+            selected.append(quoted)
+    return "SELECT {} FROM users".format(", ".join(selected))
+
+
+def stream_users(cursor, logger: logging.Logger, batch_size: int = STREAM_BATCH_SIZE,
+                 query: str = USERS_QUERY) -> int:
+    """
+    Streams the users table through the redacting logger with bounded memory.
+
+    Rows flow through a generator pipeline (row -> redact -> emit); rows are
+    logged as mappings, so the RedactingFormatter redacts them by key.
+
+    Args:
+        cursor: An unbuffered dictionary cursor, see DatabaseBackend.dict_cursor.
+        logger (logging.Logger): The redacting logger to emit records on.
+        batch_size (int): Number of rows fetched per round trip.
+        query (str): The users query, see masked_users_query.
+
+    Returns:
+        int: The number of rows exported.
+    """
+    cursor.execute(query)
+    count = 0
+    for row in iter_rows(cursor, batch_size):
+        logger.info(row)
+        count += 1
+    return count
+
+
+def partition_ranges(low: int, high: int, partitions: int) -> List[Tuple[int, int]]:
+    """
+    Splits the inclusive key range [low, high] into contiguous half-open ranges.
+
+    Args:
+        low (int): Smallest key.
+        high (int): Largest key.
+        partitions (int): Number of ranges wanted.
+
+    Returns:
+        List[Tuple[int, int]]: The (start, stop) ranges, in key order.
+    """
+    partitions = max(1, min(partitions, high - low + 1))
+    step, extra = divmod(high - low + 1, partitions)
+    ranges = []
+    start = low
+    for i in range(partitions):
+        stop = start + step + (1 if i < extra else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def export_partition(query: str, key: str, start: int, stop: int) -> List[str]:
+    """
+    Reads and redacts the users whose key lies in [start, stop).
+
+    Runs in a worker process on its own pooled connection, and formats every
+    row with RedactingFormatter exactly as the user_data logger would.
+
+    Args:
+        query (str): The users query, see masked_users_query.
+        key (str): Quoted numeric primary key column.
+        start (int): First key of the range.
+        stop (int): Key following the range.
+
+    Returns:
+        List[str]: The formatted log lines, in key order.
+    """
+    pool = get_pool()
+    formatter = RedactingFormatter(fields=PII_FIELDS)
+    with pool.connection() as db_connection:
+        cursor = pool.backend.dict_cursor(db_connection)
+        try:
+            cursor.execute(f"{query} WHERE {key} >= {int(start)} AND {key} < {int(stop)} ORDER BY {key}")
+            return [formatter.format(logging.LogRecord("user_data", logging.INFO, __file__, 0, row, None, None))
+                    for row in iter_rows(cursor)]
+        finally:
+            cursor.close()
+
+
+def export_partitioned(pool: ConnectionPool, query: str, key: str, partitions: int,
+                       workers: int, stream=None) -> int:
+    """
+    Exports the users table by primary-key ranges across worker processes.
+
+    Each range is read on its own connection and redacted in a worker; lines
+    are written in key order, with at most two ranges per worker in flight.
+
+    Args:
+        pool (ConnectionPool): Pool used to read the key bounds.
+        query (str): The users query, see masked_users_query.
+        key (str): Numeric primary key column.
+        partitions (int): Number of key ranges.
+        workers (int): Number of worker processes.
+        stream: Text stream the lines are written to, stderr by default.
+
+    Returns:
+        int: The number of rows exported.
+    """
+    stream = stream if stream is not None else sys.stderr
+    quoted_key = pool.backend.quote_identifier(key)
+    with pool.connection() as db_connection:
+        cursor = pool.backend.dict_cursor(db_connection)
+        try:
+            cursor.execute(f"SELECT MIN({quoted_key}) AS low, MAX({quoted_key}) AS high FROM users")
+            bounds = cursor.fetchall()[0]
+        finally:
+            cursor.close()
+    if bounds["low"] is None:
+        return 0
+
+    count = 0
+    # Spawned workers never inherit (and later close) this process's open connections
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        pending: deque = deque()
+        for start, stop in partition_ranges(int(bounds["low"]), int(bounds["high"]), partitions):
+            pending.append(executor.submit(export_partition, query, quoted_key, start, stop))
+            if len(pending) >= 2 * workers:
+                lines = pending.popleft().result()
+                stream.write("".join(line + "\n" for line in lines))
+                count += len(lines)
+        while pending:
+            lines = pending.popleft().result()
+            stream.write("".join(line + "\n" for line in lines))
+            count += len(lines)
+    stream.flush()
+    return count
+
+
+def main(stream: bool = False, batch_size: int = STREAM_BATCH_SIZE, mask_in_sql: bool = False,
+         partitions: int = 0, partition_key: str = "id", workers: Optional[int] = None) -> None:
+    """
+    Connects to the database, retrieves all rows from the users table, and displays each row under a filtered format.
+
+    The connection comes from the shared pool, so the backend is selected by
+    PERSONAL_DATA_DB_BACKEND (see get_backend).
+
+    Args:
+        stream (bool): Fetch rows in batches from an unbuffered cursor instead of
+            loading the whole table, and report rows/s and peak RSS on stderr.
+        batch_size (int): Number of rows fetched per round trip in streaming mode.
+        mask_in_sql (bool): Select the redaction constant instead of PII
+            columns, see masked_users_query.
+        partitions (int): When positive, split the table into this many
+            ranges of `partition_key` and export them in parallel, see
+            export_partitioned.
+        partition_key (str): Numeric primary key column used for partitioning.
+        workers (Optional[int]): Worker processes of the partitioned export,
+            defaults to the number of CPUs.
+    """
+    try:
+        pool = get_pool()
+        if partitions > 0:
+            query = USERS_QUERY
+            if mask_in_sql:
+                # Back in the pool before the export, which reads the key
+                # bounds on a pooled connection of its own
+                with pool.connection() as db_connection:
+                    cursor = pool.backend.dict_cursor(db_connection)
+                    try:
+                        query = masked_users_query(cursor, pool.backend)
+                    finally:
+                        cursor.close()
+            start = time.perf_counter()
+            count = export_partitioned(pool, query, partition_key, partitions,
+                                       workers or os.cpu_count() or 1)
+            elapsed = time.perf_counter() - start
+            rate = count / elapsed if elapsed > 0 else 0.0
+            print(f"Exported {count} rows in {elapsed:.2f}s ({rate:.0f} rows/s)", file=sys.stderr)
+        else:
+            with pool.connection() as db_connection:
+                cursor = pool.backend.dict_cursor(db_connection, buffered=not stream)
+                try:
+                    # Get the logger
+                    logger = get_logger()
+
+                    query = masked_users_query(cursor, pool.backend) if mask_in_sql else USERS_QUERY
+                    if stream:
+                        start = time.perf_counter()
+                        count = stream_users(cursor, logger, batch_size, query)
+                        elapsed = time.perf_counter() - start
+                        rate = count / elapsed if elapsed > 0 else 0.0
+                        print(f"Exported {count} rows in {elapsed:.2f}s ({rate:.0f} rows/s), "
+                              f"peak RSS {peak_rss_kib()} KiB", file=sys.stderr)
+                    else:
+                        cursor.execute(query)
+                        rows = cursor.fetchall()
+
+                        # Display each row in the specified format; the formatter
+                        # redacts mappings by key before building the message
+                        for row in rows:
+                            logger.info(row)
+                finally:
+                    cursor.close()
+
+        # Print the filtered fields
+        print("Filtered fields:")
+        for field in PII_FIELDS:
+            print(field)
 
     except Exception as e:
         print(f"An error occurred: {e}")
-    finally:
-        # Ensure the database connection is closed
-        if db_connection.is_connected():
-            db_connection.close()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """
+    Parses the command line options of the export.
+
+    Args:
+        argv (Optional[List[str]]): Arguments to parse, defaults to sys.argv.
+
+    Returns:
+        argparse.Namespace: The parsed options.
+    """
+    parser = argparse.ArgumentParser(description="Log the users table with PII redacted.")
+    parser.add_argument("--stream", action="store_true",
+                        help="fetch rows in batches instead of loading the whole table")
+    parser.add_argument("--batch-size", type=int, default=STREAM_BATCH_SIZE,
+                        help="rows per fetch in streaming mode (default: %(default)s)")
+    parser.add_argument("--mask-in-sql", action="store_true",
+                        help="replace PII columns by the redaction constant in the query")
+    parser.add_argument("--partitions", type=int, default=0,
+                        help="export this many primary-key ranges in parallel (default: off)")
+    parser.add_argument("--partition-key", default="id",
+                        help="numeric primary key column used to partition (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes of the partitioned export (default: CPU count)")
+    return parser.parse_args(argv)
 
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    main(stream=args.stream, batch_size=args.batch_size, mask_in_sql=args.mask_in_sql,
+         partitions=args.partitions, partition_key=args.partition_key, workers=args.workers)
@@ -3,8 +3,8 @@
 Module for initializing Flask Blueprints.
 
 This module sets up the Flask Blueprint for the API version 1, including
-the routes and views for the application. It also loads user data from
-a file.
+the routes and views for the application. The stores are loaded by
+api.v1.views (see MODELS_LOADING).
 """
 
 from flask import Blueprint
@@ -16,6 +16,3 @@ app_views = Blueprint("app_views", __name__, url_prefix="/api/v1")
 from api.v1.views.index import *
 from api.v1.views.users import *
 from api.v1.views.session_auth import *
-
-# Load user data from a file
-User.load_from_file()
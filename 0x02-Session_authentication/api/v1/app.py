@@ -8,7 +8,7 @@ It also defines error handlers and a before_request function to filter requests.
 """
 
 from os import getenv
-from api.v1.views import app_views
+from api.v1.views import app_views, LOADER, MODELS_LOADING_TIMEOUT
 from flask import Flask, jsonify, abort, request
 from flask_cors import CORS
 import os
@@ -70,6 +70,21 @@ def forbidden(error) -> str:
     """
     return jsonify({"error": "Forbidden"}), 403
 
+@app.errorhandler(503)
+def service_unavailable(error) -> str:
+    """
+    Handler for 503 errors, raised while the stores are still loading.
+
+    Args:
+        error: The error object.
+
+    Returns:
+        str: A JSON response with error message and status code 503.
+    """
+    response = jsonify({"error": "Service unavailable"})
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
 @app.before_request
 def before_request():
     """
@@ -81,7 +96,13 @@ def before_request():
     Raises:
         401: If the Authorization header is missing.
         403: If the current user is not authenticated.
+        503: If the stores are not loaded within MODELS_LOADING_TIMEOUT.
     """
+    # The status endpoint reports the loading progress itself
+    if request.path.rstrip('/') != '/api/v1/status' and \
+            not LOADER.wait(MODELS_LOADING_TIMEOUT):
+        abort(503)
+
     if auth is None:
         return
 
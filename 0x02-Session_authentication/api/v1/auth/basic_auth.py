@@ -7,9 +7,8 @@ This module contains the BasicAuth class which implements basic authentication.
 
 import base64
 from api.v1.auth.auth import Auth
-from typing import TypeVar, Optional
-
-User = TypeVar('User')  # This should be replaced with the actual User class import if available
+from typing import Optional
+from models.user import User
 
 class BasicAuth(Auth):
     """
@@ -93,8 +92,8 @@ class BasicAuth(Auth):
         if not isinstance(user_pwd, str) or user_pwd is None:
             return None
 
-        # Assuming User class has a class method search to find users by email
-        users = User.search(user_email)
+        # The email index answers this without scanning every user
+        users = User.search({'email': user_email})
         if not users:
             return None
         
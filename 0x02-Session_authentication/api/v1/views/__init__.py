@@ -1,12 +1,25 @@
 #!/usr/bin/env python3
 """ DocDocDocDocDocDoc
 """
+from os import getenv
 from flask import Blueprint
+from models.loader import Loader
+from models.user import User
+from models.user_session import UserSession
 
 app_views = Blueprint("app_views", __name__, url_prefix="/api/v1")
 
+# "eager" loads the stores at import time, "background" in a thread while
+# the app starts serving; requests wait for the stores (see api.v1.app)
+MODELS_LOADING = getenv('MODELS_LOADING', 'eager')
+# Seconds a request waits for the stores before answering 503
+MODELS_LOADING_TIMEOUT = float(getenv('MODELS_LOADING_TIMEOUT', '30'))
+LOADER = Loader((User, UserSession))
+
 from api.v1.views.index import *
 from api.v1.views.users import *
 
-User.load_from_file()
-
+if MODELS_LOADING == 'background':
+    LOADER.start()
+else:
+    LOADER.load()
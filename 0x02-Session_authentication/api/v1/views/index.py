@@ -2,7 +2,7 @@
 """ Module of Index views
 """
 from flask import jsonify, abort
-from api.v1.views import app_views
+from api.v1.views import app_views, LOADER
 
 
 @app_views.route('/status', methods=['GET'], strict_slashes=False)
@@ -10,7 +10,10 @@ def status() -> str:
     """ GET /api/v1/status
     Return:
       - the status of the API
+      - 503 with the loading progress while the stores are loading
     """
+    if not LOADER.ready.is_set():
+        return jsonify(dict(LOADER.progress(), status="LOADING")), 503
     return jsonify({"status": "OK"})
 
 
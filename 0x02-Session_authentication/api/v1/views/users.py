@@ -1,112 +1,356 @@
 #!/usr/bin/env python3
+""" Module of Users views
 """
-Route module for the API.
+from api.v1.views import app_views
+from datetime import datetime, timezone
+from flask import (Response, abort, current_app, jsonify, request,
+                   stream_with_context)
+from models.base import Base
+from models.user import User
+from typing import Iterator, Optional, Tuple
+from urllib.parse import urlencode
+import base64
+import json
 
-This module sets up the Flask application, registers the API views,
-configures CORS, and manages authentication based on environment variables.
-It also defines error handlers and a before_request function to filter requests.
-"""
+# Query parameters of GET /api/v1/users -> Base.query filters
+USER_FILTERS = {
+    'email': 'email',
+    'first_name': 'first_name',
+    'last_name': 'last_name',
+    'created_after': 'created_at__gt',
+    'created_before': 'created_at__lt',
+    'updated_after': 'updated_at__gt',
+    'updated_before': 'updated_at__lt',
+}
+# Orders of GET /api/v1/users: the attributes with a sorted index, so every
+# page, and every page of a stream, starts at its cursor
+USER_ORDERS = User.ordered_attributes
+# Order of pages and streams when the request has none
+DEFAULT_ORDER = 'created_at'
+# Users read per query while streaming
+STREAM_PAGE_SIZE = 500
+# Operations accepted by POST /api/v1/users/batch
+BATCH_OPERATIONS = ('create', 'update', 'delete')
+BATCH_MAX_SIZE = 10000
 
-from os import getenv
-from api.v1.views import app_views
-from flask import Flask, jsonify, abort, request
-from flask_cors import CORS
-
-app = Flask(__name__)
-app.register_blueprint(app_views)
-CORS(app, resources={r"/api/v1/*": {"origins": "*"}})
-
-# Initialize the auth variable
-auth = None
-
-# Load the appropriate auth class based on the environment variable
-AUTH_TYPE = getenv("AUTH_TYPE")
-
-if AUTH_TYPE:
-    if AUTH_TYPE == "basic_auth":
-        from api.v1.auth.basic_auth import BasicAuth
-        auth = BasicAuth()
-    elif AUTH_TYPE == "auth":
-        from api.v1.auth.auth import Auth
-        auth = Auth()
-    elif AUTH_TYPE == "session_auth":
-        from api.v1.auth.session_auth import SessionAuth
-        auth = SessionAuth()
-
-@app.errorhandler(404)
-def not_found(error) -> str:
+
+def parse_datetime(value: str) -> datetime:
+    """ Parse an ISO 8601 date or datetime as naive UTC
     """
-    Handler for 404 errors.
+    result = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if result.tzinfo is not None:
+        result = result.astimezone(timezone.utc).replace(tzinfo=None)
+    return result
 
-    Args:
-        error: The error object.
 
-    Returns:
-        str: A JSON response with error message and status code 404.
+def encode_cursor(order: str, user: User) -> str:
+    """ Opaque cursor of the position of a user in an order
     """
-    return jsonify({"error": "Not found"}), 404
+    value = getattr(user, order.lstrip('-'), None)
+    if isinstance(value, datetime):
+        value = {'dt': value.isoformat()}
+    data = json.dumps([order, value, user.id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
 
-@app.errorhandler(401)
-def unauthorized(error) -> str:
+def decode_cursor(cursor: str, order: str) -> Tuple:
+    """ (value, id) position of a cursor made for the given order
     """
-    Handler for 401 errors.
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_order, value, user_id = json.loads(data)
+        if isinstance(value, dict):
+            value = datetime.fromisoformat(value['dt'])
+    except (ValueError, TypeError, KeyError):
+        raise ValueError("Invalid cursor")
+    if cursor_order != order or not isinstance(user_id, str):
+        raise ValueError("Invalid cursor for order {}".format(order))
+    return value, user_id
 
-    Args:
-        error: The error object.
 
-    Returns:
-        str: A JSON response with error message and status code 401.
+def stream_users(filters: dict, order: str, limit: Optional[int],
+                 offset: int, after: Optional[Tuple]) -> Iterator[str]:
+    """ JSON array of the matching users, read and written one page at a
+        time, each page starting after the last user of the previous one
     """
-    return jsonify({"error": "Unauthorized"}), 401
+    attribute = order.lstrip('-')
+    json_provider = current_app.json
+    separator = ''
+    yield '['
+    while limit is None or limit > 0:
+        size = STREAM_PAGE_SIZE if limit is None \
+            else min(STREAM_PAGE_SIZE, limit)
+        users = User.query(filters, order, size, offset, after)
+        for user in users:
+            yield separator + json_provider.dumps(user.to_json())
+            separator = ','
+        if len(users) < size:
+            break
+        if limit is not None:
+            limit -= len(users)
+        offset = 0
+        after = (getattr(users[-1], attribute, None), users[-1].id)
+    yield ']'
+
 
-@app.errorhandler(403)
-def forbidden(error) -> str:
+@app_views.route('/users', methods=['GET'], strict_slashes=False)
+def view_all_users() -> str:
+    """ GET /api/v1/users
+    Query parameters (optional):
+      - email, first_name, last_name: exact match
+      - created_after, created_before, updated_after, updated_before:
+        ISO 8601 date or datetime, UTC unless an offset is given
+      - order: attribute to sort by, "-" prefixed for descending order,
+        created_at by default
+      - limit: size of the page, the `Link` header of a full page gives
+        the URL of the next one (rel="next")
+      - after: cursor of the last user of the previous page
+      - offset
+      - stream: 1 to write the list while reading it, the default when
+        there is no limit
+    Return:
+      - list of the matching User objects JSON represented
+      - 400 if a parameter is invalid
     """
-    Handler for 403 errors.
+    filters = {}
+    try:
+        for param, key in USER_FILTERS.items():
+            value = request.args.get(param)
+            if value is None:
+                continue
+            if key.endswith(('__gt', '__lt')):
+                value = parse_datetime(value)
+            filters[key] = value
+        order = request.args.get('order')
+        if order is not None and order.lstrip('-') not in USER_ORDERS:
+            raise ValueError("order must be one of {}"
+                             .format(", ".join(USER_ORDERS)))
+        limit = request.args.get('limit')
+        limit = int(limit) if limit is not None else None
+        offset = int(request.args.get('offset', 0))
+        if (limit is not None and limit < 0) or offset < 0:
+            raise ValueError("limit and offset can't be negative")
+        if order is None:
+            order = DEFAULT_ORDER
+        after = request.args.get('after')
+        if after is not None:
+            after = decode_cursor(after, order)
+        stream = request.args.get('stream', '0').lower() in ('1', 'true')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    Args:
-        error: The error object.
+    if stream or limit is None:
+        return Response(stream_with_context(
+            stream_users(filters, order, limit, offset, after)),
+            mimetype='application/json')
+    users = User.query(filters, order, limit, offset, after)
+    response = jsonify([user.to_json() for user in users])
+    if limit > 0 and len(users) == limit:
+        args = request.args.to_dict()
+        args.pop('offset', None)
+        args['after'] = encode_cursor(order, users[-1])
+        response.headers['Link'] = '<{}?{}>; rel="next"'.format(
+            request.base_url, urlencode(args))
+    return response
 
-    Returns:
-        str: A JSON response with error message and status code 403.
+
+@app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
+def view_one_user(user_id: str = None) -> str:
+    """ GET /api/v1/users/:id
+    Path parameter:
+      - User ID
+    Header (optional):
+      - If-None-Match: ETag of the User the client has
+    Return:
+      - User object JSON represented, with its ETag
+      - 304 if the User still has the If-None-Match ETag
+      - 404 if the User ID doesn't exist
     """
-    return jsonify({"error": "Forbidden"}), 403
+    if user_id is None:
+        abort(404)
+    user = User.get(user_id)
+    if user is None:
+        abort(404)
+    response = current_app.response_class(user.json_bytes(),
+                                          mimetype='application/json')
+    response.set_etag(user.etag())
+    return response.make_conditional(request)
+
 
-@app.before_request
-def before_request():
+@app_views.route('/users/<user_id>', methods=['DELETE'], strict_slashes=False)
+def delete_user(user_id: str = None) -> str:
+    """ DELETE /api/v1/users/:id
+    Path parameter:
+      - User ID
+    Return:
+      - empty JSON is the User has been correctly deleted
+      - 404 if the User ID doesn't exist
     """
-    Filters requests to handle authentication before processing the request.
-    
-    If authentication is required:
-    - Checks if the Authorization header or session cookie is present and valid.
-    - Checks if the current user is authenticated.
-    Raises:
-        401: If the Authorization header or session cookie is missing.
-        403: If the current user is not authenticated.
+    if user_id is None:
+        abort(404)
+    user = User.get(user_id)
+    if user is None:
+        abort(404)
+    user.remove()
+    return jsonify({}), 200
+
+
+@app_views.route('/users', methods=['POST'], strict_slashes=False)
+def create_user() -> str:
+    """ POST /api/v1/users/
+    JSON body:
+      - email
+      - password
+      - last_name (optional)
+      - first_name (optional)
+    Return:
+      - User object JSON represented
+      - 400 if can't create the new User
     """
-    if auth is None:
-        return
-
-    # Set the current user in the request
-    setattr(request, "current_user", auth.current_user(request))
-
-    # List of paths that do not require authentication
-    excluded_paths = [
-        '/api/v1/status/',
-        '/api/v1/unauthorized/',
-        '/api/v1/forbidden/',
-        '/api/v1/auth_session/login/'
-    ]
-    
-    # Check if the request path requires authentication
-    if auth.require_auth(request.path, excluded_paths):
-        cookie = auth.session_cookie(request)
-        if auth.authorization_header(request) is None and cookie is None:
-            abort(401)
-        if auth.current_user(request) is None:
-            abort(403)
-
-if __name__ == "__main__":
-    host = getenv("API_HOST", "0.0.0.0")
-    port = getenv("API_PORT", "5000")
-    app.run(host=host, port=port)
+    rj = None
+    error_msg = None
+    try:
+        rj = request.get_json()
+    except Exception as e:
+        rj = None
+    if rj is None:
+        error_msg = "Wrong format"
+    if error_msg is None and rj.get("email", "") == "":
+        error_msg = "email missing"
+    if error_msg is None and rj.get("password", "") == "":
+        error_msg = "password missing"
+    if error_msg is None:
+        try:
+            user = User()
+            user.email = rj.get("email")
+            user.password = rj.get("password")
+            user.first_name = rj.get("first_name")
+            user.last_name = rj.get("last_name")
+            user.save()
+            return jsonify(user.to_json()), 201
+        except Exception as e:
+            error_msg = "Can't create User: {}".format(e)
+    return jsonify({'error': error_msg}), 400
+
+
+@app_views.route('/users/<user_id>', methods=['PUT'], strict_slashes=False)
+def update_user(user_id: str = None) -> str:
+    """ PUT /api/v1/users/:id
+    Path parameter:
+      - User ID
+    JSON body:
+      - last_name (optional)
+      - first_name (optional)
+    Return:
+      - User object JSON represented
+      - 404 if the User ID doesn't exist
+      - 400 if can't update the User
+    """
+    if user_id is None:
+        abort(404)
+    user = User.get(user_id)
+    if user is None:
+        abort(404)
+    rj = None
+    try:
+        rj = request.get_json()
+    except Exception as e:
+        rj = None
+    if rj is None:
+        return jsonify({'error': "Wrong format"}), 400
+    if rj.get('first_name') is not None:
+        user.first_name = rj.get('first_name')
+    if rj.get('last_name') is not None:
+        user.last_name = rj.get('last_name')
+    user.save()
+    return jsonify(user.to_json()), 200
+
+
+def check_operation(item) -> Optional[dict]:
+    """ Error result of an invalid operation of POST /api/v1/users/batch,
+        None if it is valid
+    """
+    if not isinstance(item, dict):
+        return {'status': 400, 'error': "Wrong format"}
+    op = item.get('op', 'create')
+    if op not in BATCH_OPERATIONS:
+        return {'status': 400, 'error': "op must be one of {}".format(
+            ", ".join(BATCH_OPERATIONS))}
+    if op == 'create' and item.get("email", "") == "":
+        return {'status': 400, 'error': "email missing"}
+    if op == 'create' and item.get("password", "") == "":
+        return {'status': 400, 'error': "password missing"}
+    if op != 'create' and not isinstance(item.get('id'), str):
+        return {'status': 400, 'error': "id missing"}
+    return None
+
+
+def apply_operation(item: dict) -> dict:
+    """ Apply a valid operation of POST /api/v1/users/batch
+    """
+    op = item.get('op', 'create')
+    user = None
+    if op != 'create':
+        # Read now: an earlier operation of the batch may have changed it
+        user = User.get(item['id'])
+        if user is None:
+            return {'status': 404, 'error': "Not found"}
+    if op == 'delete':
+        user.remove()
+        return {'status': 200, 'id': user.id}
+    if op == 'create':
+        user = User()
+        user.email = item.get("email")
+        user.password = item.get("password")
+        user.first_name = item.get("first_name")
+        user.last_name = item.get("last_name")
+        status = 201
+    else:
+        if item.get('first_name') is not None:
+            user.first_name = item.get('first_name')
+        if item.get('last_name') is not None:
+            user.last_name = item.get('last_name')
+        status = 200
+    user.save()
+    return {'status': status, 'user': user.to_json()}
+
+
+@app_views.route('/users/batch', methods=['POST'], strict_slashes=False)
+def batch_users() -> str:
+    """ POST /api/v1/users/batch
+    JSON body: list of operations, each one of
+      - {"op": "create", "email", "password", "first_name" (optional),
+        "last_name" (optional)}, "op" being optional for a creation
+      - {"op": "update", "id", "first_name" (optional),
+        "last_name" (optional)}
+      - {"op": "delete", "id"}
+    Every operation is checked first, then the valid ones are applied in
+    order and the users are persisted once at the end.
+    Return:
+      - list of the results of the operations, in order: "status" (201,
+        200, 400 or 404), then "user" (User object JSON represented), "id"
+        (deleted User ID) or "error"
+      - 400 if the body isn't a list of at most BATCH_MAX_SIZE operations
+    """
+    try:
+        rj = request.get_json()
+    except Exception as e:
+        rj = None
+    if not isinstance(rj, list):
+        return jsonify({'error': "Wrong format"}), 400
+    if len(rj) > BATCH_MAX_SIZE:
+        return jsonify({'error': "At most {} operations"
+                        .format(BATCH_MAX_SIZE)}), 400
+
+    results = [check_operation(item) for item in rj]
+    with Base.batch():
+        for i, item in enumerate(rj):
+            if results[i] is not None:
+                continue
+            try:
+                results[i] = apply_operation(item)
+            except Exception as e:
+                results[i] = {'status': 400,
+                              'error': "Can't apply operation: {}"
+                              .format(e)}
+    return jsonify(results), 200
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+""" Concurrency stress benchmark of the model store
+
+Writer threads create, update and remove users while reader threads list,
+search, query and count them. Reports the operations per second of each
+kind and every exception raised, which should be none, then checks the
+file written at the end loads back to the same store.
+
+Runs in a temporary directory, with write-behind enabled unless
+DB_WRITE_BEHIND_INTERVAL is set.
+
+Usage:
+    ./benchmark_concurrency.py [--users 10000] [--writers 4] [--readers 4]
+                               [--seconds 10]
+"""
+import argparse
+import collections
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+os.environ.setdefault('DB_WRITE_BEHIND_INTERVAL', '0.5')
+
+from models.base import Base  # noqa: E402
+from models.user import User  # noqa: E402
+
+
+def writer(stop: threading.Event, counts: collections.Counter,
+           errors: list, ids: list, seed: int):
+    """ Create, update and remove users until stopped
+    """
+    rng = random.Random(seed)
+    while not stop.is_set():
+        try:
+            op = rng.random()
+            if op < 0.4:
+                user = User(email="{}@example.com".format(rng.getrandbits(64)))
+                user.password = "pwd"
+                user.save()
+                ids.append(user.id)
+                counts['create'] += 1
+                continue
+            user = User.get(rng.choice(ids))
+            if user is None:
+                continue
+            if op < 0.8:
+                user.first_name = "First{}".format(rng.randrange(100))
+                user.save()
+                counts['update'] += 1
+            else:
+                user.remove()
+                counts['remove'] += 1
+        except Exception:
+            errors.append(traceback.format_exc())
+
+
+def reader(stop: threading.Event, counts: collections.Counter,
+           errors: list, seed: int):
+    """ List, search, query and count users until stopped
+    """
+    rng = random.Random(seed)
+    while not stop.is_set():
+        try:
+            op = rng.random()
+            if op < 0.25:
+                len(User.all())
+                counts['all'] += 1
+            elif op < 0.5:
+                User.search({'first_name': "First{}".format(
+                    rng.randrange(100))})
+                counts['search'] += 1
+            elif op < 0.75:
+                User.query({}, '-updated_at', 10)
+                counts['query'] += 1
+            else:
+                User.count()
+                counts['count'] += 1
+        except Exception:
+            errors.append(traceback.format_exc())
+
+
+def main():
+    """ Run the stress test and print its report
+    """
+    parser = argparse.ArgumentParser(
+        description="Stress the model store from concurrent threads.")
+    parser.add_argument("--users", type=int, default=10000,
+                        help="users created up front (default: %(default)s)")
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--switch-interval", type=float, default=1e-4,
+                        help="thread switch interval, small values make "
+                        "races likelier (default: %(default)s)")
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="benchmark_concurrency_"))
+    sys.setswitchinterval(args.switch_interval)
+    User.load_from_file()
+    ids = []
+    with Base.batch():
+        for i in range(args.users):
+            user = User(email="seed{}@example.com".format(i))
+            user.save()
+            ids.append(user.id)
+
+    stop = threading.Event()
+    write_counts = collections.Counter()
+    read_counts = collections.Counter()
+    errors = []
+    threads = [threading.Thread(target=writer,
+                                args=(stop, write_counts, errors, ids, i))
+               for i in range(args.writers)]
+    threads += [threading.Thread(target=reader,
+                                 args=(stop, read_counts, errors, -1 - i))
+                for i in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    Base.flush()
+
+    for kind, counts in (("write", write_counts), ("read", read_counts)):
+        for op, count in sorted(counts.items()):
+            print("{:>6} {:>7} {:>10.0f} ops/s".format(
+                kind, op, count / args.seconds))
+    users = User.count()
+    User.load_from_file()
+    print("users {} in memory, {} reloaded from file".format(
+        users, User.count()))
+    print("{} errors".format(len(errors)))
+    for error in errors[:5]:
+        print(error, file=sys.stderr)
+    if errors or users != User.count():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+""" Memory benchmark of the model stores
+
+Builds N User and N UserSession objects the way load_from_file does (from
+JSON records, so every string starts as a distinct object) and reports
+the memory held per object, next to the same records kept as plain
+__dict__ objects with one datetime per timestamp.
+
+Each store is built in a fresh process and measured as the growth of its
+resident memory (Linux /proc), since tracing a million allocations with
+tracemalloc takes too long.
+
+Usage:
+    ./benchmark_memory.py [--objects 1000000]
+"""
+from datetime import datetime
+import argparse
+import gc
+import multiprocessing
+import os
+import random
+import uuid
+
+from models.base import DATA, TIMESTAMP_FORMAT
+from models.user import User
+from models.user_session import UserSession
+
+
+class DictRecord():
+    """ Baseline: attributes in a per-object __dict__
+    """
+
+    def __init__(self, **kwargs):
+        """ Initialize a record from its JSON
+        """
+        for key, value in kwargs.items():
+            if key in ('created_at', 'updated_at'):
+                value = datetime.strptime(value, TIMESTAMP_FORMAT)
+            setattr(self, key, value)
+
+
+def make_records(kind: str, count: int, seed: int = 0):
+    """ Yield JSON records of users or sessions
+
+    Timestamps spread over a day, names come from a small pool and every
+    session belongs to one of count / 4 users
+    """
+    rng = random.Random(seed)
+    user_ids = [rng.getrandbits(128) for _ in range(max(1, count // 4))]
+    for i in range(count):
+        seconds = rng.randrange(86400)
+        timestamp = "2024-01-01T{:02d}:{:02d}:{:02d}".format(
+            seconds // 3600, seconds // 60 % 60, seconds % 60)
+        record = {
+            'id': str(uuid.UUID(int=rng.getrandbits(128))),
+            'created_at': timestamp,
+            'updated_at': timestamp,
+        }
+        if kind == 'User':
+            record.update({
+                'email': "user{}@example.com".format(i),
+                '_password': "{:064x}".format(rng.getrandbits(256)),
+                'first_name': "First{}".format(rng.randrange(500)),
+                'last_name': "Last{}".format(rng.randrange(2000)),
+            })
+        else:
+            record.update({
+                'user_id': str(uuid.UUID(int=rng.choice(user_ids))),
+                'session_id': str(uuid.UUID(int=rng.getrandbits(128))),
+            })
+        yield record
+
+
+def resident_memory() -> int:
+    """ Resident memory of the process, in bytes
+    """
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def measure(compact: bool, kind: str, count: int) -> float:
+    """ Bytes held per object by a store of `count` objects
+    """
+    build = {'User': User, 'UserSession': UserSession}[kind] \
+        if compact else DictRecord
+    gc.collect()
+    before = resident_memory()
+    store = {}
+    for record in make_records(kind, count):
+        obj = build(**record)
+        store[obj.id] = obj
+    gc.collect()
+    after = resident_memory()
+    del store
+    DATA.clear()
+    return (after - before) / count
+
+
+def measure_in_process(compact: bool, kind: str, count: int) -> float:
+    """ Run `measure` in a fresh process
+    """
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        return pool.apply(measure, (compact, kind, count))
+
+
+def main():
+    """ Print the bytes per object of each representation
+    """
+    parser = argparse.ArgumentParser(
+        description="Memory held by the User and UserSession stores.")
+    parser.add_argument("--objects", type=int, default=10 ** 6,
+                        help="objects per class (default: %(default)s)")
+    args = parser.parse_args()
+
+    print("{:>12} {:>12} {:>12} {:>10}".format(
+        "class", "dict B/obj", "model B/obj", "saved"))
+    for cls in (User, UserSession):
+        s_class = cls.__name__
+        baseline = measure_in_process(False, s_class, args.objects)
+        compact = measure_in_process(True, s_class, args.objects)
+        print("{:>12} {:>12.0f} {:>12.0f} {:>9.0%}".format(
+            s_class, baseline, compact, 1 - compact / baseline))
+        print("{:>12} {:>12.0f} {:>12.0f} MB for {} objects".format(
+            "", baseline * args.objects / 2 ** 20,
+            compact * args.objects / 2 ** 20, args.objects))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,20 +2,366 @@
 """ Base module
 """
 from datetime import datetime
-from typing import TypeVar, List, Iterable
-from os import path
+from typing import TypeVar, List, Iterable, Iterator, Optional, Tuple
+from itertools import islice
+from contextlib import contextmanager
+from os import getenv, path
+from types import MappingProxyType
+from models.journal import Journal
+from models.snapshot import LazyStore, Snapshot, write_snapshot
+from models.storage import get_storage, split_filters
+from functools import lru_cache
+import atexit
+import bisect
+import hashlib
 import json
+import os
+import sys
+import threading
+import time
+import traceback
 import uuid
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+# "file" rewrites .db_<Class>.json on every change, "journal" appends
+# one record per change to .db_<Class>.journal (see models.journal)
+PERSISTENCE = getenv('DB_PERSISTENCE', 'file')
+# Snapshot format: "json" (.db_<Class>.json) or "binary" (.db_<Class>.snap,
+# memory-mapped and decoded one object at a time, see models.snapshot)
+SNAPSHOT_FORMAT = getenv('DB_SNAPSHOT_FORMAT', 'json')
+# In "file" mode, seconds between background flushes of changed classes;
+# 0 writes the file on every save() and remove()
+WRITE_BEHIND_INTERVAL = float(getenv('DB_WRITE_BEHIND_INTERVAL', '0'))
+# Storage backend replacing the in-process store and its files, None by
+# default (see models.storage, DB_STORAGE)
+STORAGE = get_storage(TIMESTAMP_FORMAT)
 DATA = {}
+INDEXES = {}
+JOURNALS = {}
+DIRTY = set()
+# Per class: write lock, store version (bumped by every write) and the
+# last (version, read-only copy) handed to readers
+LOCKS = {}
+VERSIONS = {}
+SNAPSHOTS = {}
+# Per class: {id: (updated_at, JSON bytes, ETag)} of objects serialized by
+# json_bytes(), dropped by save() and remove()
+JSON_CACHE = {}
+JSON_CACHE_SIZE = int(getenv('DB_JSON_CACHE_SIZE', '100000'))
+
+_SLOT_NAMES = {}
+# Objects read from a sorted index per lock acquisition
+RANGE_CHUNK = 256
+
+_dirty_lock = threading.Lock()
+_locks_lock = threading.Lock()
+_batch_state = threading.local()
+_flusher = None
+
+
+@lru_cache(maxsize=65536)
+def parse_timestamp(value: str) -> datetime:
+    """ Parse a TIMESTAMP_FORMAT string
+
+    Objects saved in the same second share one (immutable) datetime
+    """
+    return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+def intern_string(value):
+    """ Intern a string so repeated values share one object
+    """
+    if type(value) is str:
+        return sys.intern(value)
+    return value
+
+
+def _slot_names(cls) -> Tuple[str, ...]:
+    """ Attribute slots of a class, base classes first
+    """
+    names = _SLOT_NAMES.get(cls)
+    if names is None:
+        names = []
+        for klass in reversed(cls.__mro__):
+            slots = klass.__dict__.get('__slots__', ())
+            if isinstance(slots, str):
+                slots = (slots,)
+            names.extend(name for name in slots
+                         if name not in ('__dict__', '__weakref__'))
+        names = _SLOT_NAMES[cls] = tuple(names)
+    return names
+
+
+class _Top():
+    """ Compares greater than any value
+    """
+
+    def __lt__(self, other) -> bool:
+        return False
+
+    def __gt__(self, other) -> bool:
+        return True
+
+
+_TOP = _Top()
+
+
+class AttributeIndex():
+    """ Indexes of the objects of one class by attribute value
+
+    Hash indexes answer equality on `attributes`; sorted indexes, lists
+    of (value, id, object), answer ranges and ordering on `ordered`. The
+    sorted indexes are built on first use, so loading a store never
+    sorts it
+    """
+
+    def __init__(self, attributes: Iterable[str], ordered: Iterable[str] = (),
+                 objects: dict = None):
+        """ Initialize an empty index on the given attributes
+
+        `objects` is the {id: object} store the sorted indexes are built
+        from
+        """
+        self.attributes = tuple(attributes)
+        self.values = {attribute: {} for attribute in self.attributes}
+        self.keys = {}
+        self.ordered_attributes = tuple(ordered)
+        self.objects = objects if objects is not None else {}
+        # attribute -> sorted entries, None until first used
+        self.ordered = None
+        # attribute -> {id: object} of the objects without a value
+        self.missing = {}
+        self.ordered_keys = {}
+        # Attributes holding values that can't be compared
+        self.unordered = set()
+        # Guards the sorted indexes, which readers bisect then slice
+        self._lock = threading.RLock()
+
+    def _lazy(self) -> bool:
+        """ Whether some objects are still only in a snapshot
+        """
+        return isinstance(self.objects, LazyStore) and \
+            not self.objects.complete
+
+    def add(self, obj: TypeVar('Base')):
+        """ Index an object under its current attribute values
+        """
+        with self._lock:
+            self.discard(obj.id)
+            keys = {}
+            for attribute in self.attributes:
+                value = getattr(obj, attribute, None)
+                try:
+                    self.values[attribute].setdefault(value, {})[obj.id] = obj
+                except TypeError:
+                    # Unhashable values are left to the linear scan
+                    continue
+                keys[attribute] = value
+            self.keys[obj.id] = keys
+            if self.ordered is not None:
+                self._add_ordered(obj, False)
+
+    def _add_ordered(self, obj: TypeVar('Base'), append: bool):
+        """ Add an object to the sorted indexes, appending if `append`
+            (the caller sorts afterwards)
+        """
+        keys = {}
+        for attribute in self.ordered_attributes:
+            value = getattr(obj, attribute, None)
+            if value is None:
+                self.missing[attribute][obj.id] = obj
+                continue
+            entries = self.ordered[attribute]
+            try:
+                if append:
+                    entries.append((value, obj.id, obj))
+                else:
+                    bisect.insort(entries, (value, obj.id, obj))
+            except TypeError:
+                self.unordered.add(attribute)
+                continue
+            keys[attribute] = value
+        self.ordered_keys[obj.id] = keys
+
+    def discard(self, obj_id: str):
+        """ Remove an object from the index
+        """
+        with self._lock:
+            self._discard(obj_id)
+
+    def _discard(self, obj_id: str):
+        """ Remove an object from the index; the caller holds the lock
+        """
+        keys = self.keys.pop(obj_id, None)
+        for attribute, value in (keys or {}).items():
+            bucket = self.values[attribute].get(value)
+            if bucket is not None:
+                bucket.pop(obj_id, None)
+                if len(bucket) == 0:
+                    del self.values[attribute][value]
+        if self.ordered is None:
+            return
+        for attribute in self.ordered_attributes:
+            self.missing[attribute].pop(obj_id, None)
+        keys = self.ordered_keys.pop(obj_id, None)
+        for attribute, value in (keys or {}).items():
+            entries = self.ordered[attribute]
+            i = bisect.bisect_left(entries, (value, obj_id))
+            if i < len(entries) and entries[i][1] == obj_id:
+                del entries[i]
+
+    def lookup(self, attribute: str, value) -> Optional[list]:
+        """ Objects indexed under attribute == value,
+            or None if the index can't answer
+        """
+        if attribute not in self.values:
+            return None
+        try:
+            bucket = self.values[attribute].get(value)
+        except TypeError:
+            return None
+        if self._lazy():
+            obj_ids = self.objects.snapshot.lookup(attribute, value)
+            if obj_ids is None:
+                return None
+            # Decoding the objects indexes them
+            for obj_id in obj_ids:
+                self.objects.get(obj_id)
+            bucket = self.values[attribute].get(value)
+        return list(bucket.values()) if bucket is not None else []
+
+    def _build_ordered(self):
+        """ Build the sorted indexes from every object of the store;
+            the caller holds the lock
+        """
+        objs = self.objects.copy()
+        self.ordered = {attribute: [] for attribute in self.ordered_attributes}
+        self.missing = {attribute: {} for attribute in self.ordered_attributes}
+        self.ordered_keys = {}
+        for obj in objs.values():
+            self._add_ordered(obj, True)
+        for attribute, entries in self.ordered.items():
+            try:
+                entries.sort()
+            except TypeError:
+                self.unordered.add(attribute)
+
+    @staticmethod
+    def _bounds(entries: list, low, include_low: bool, high,
+                include_high: bool) -> Tuple[int, int]:
+        """ Slice of the entries between low and high
+        """
+        if low is None:
+            start = 0
+        elif include_low:
+            start = bisect.bisect_left(entries, (low,))
+        else:
+            start = bisect.bisect_right(entries, (low, _TOP))
+        if high is None:
+            end = len(entries)
+        elif include_high:
+            end = bisect.bisect_right(entries, (high, _TOP))
+        else:
+            end = bisect.bisect_left(entries, (high,))
+        return start, end
+
+    def range(self, attribute: str, low=None, include_low: bool = True,
+              high=None, include_high: bool = True, reverse: bool = False,
+              after: tuple = None) -> Optional[Iterator]:
+        """ Objects whose attribute is between low and high (None for no
+            bound), ordered by value then id, or None if the index can't
+            answer
+
+        Without bounds, objects without a value come last. `after` is a
+        (value, id) position in that order: only the objects past it are
+        returned. Objects are read in chunks, each under the lock, so the
+        walk stays correct while writers insert and remove
+        """
+        if attribute not in self.ordered_attributes or \
+                attribute in self.unordered:
+            return None
+        if self._lazy():
+            self.objects.materialize()
+        with self._lock:
+            if self.ordered is None:
+                self._build_ordered()
+            if attribute in self.unordered:
+                return None
+            try:
+                self._bounds(self.ordered[attribute], low, include_low,
+                             high, include_high)
+                if after is not None and after[0] is not None:
+                    bisect.bisect_left(self.ordered[attribute], after)
+            except TypeError:
+                return None
+        return self._walk(attribute, low, include_low, high, include_high,
+                          reverse, after)
+
+    def _walk(self, attribute: str, low, include_low: bool, high,
+              include_high: bool, reverse: bool,
+              after: Optional[tuple]) -> Iterator:
+        """ Generator of `range`
+        """
+        entries = self.ordered[attribute]
+        # (value, id) of the last object returned
+        position = after
+        while position is None or position[0] is not None:
+            with self._lock:
+                start, end = self._bounds(entries, low, include_low,
+                                          high, include_high)
+                if reverse:
+                    if position is not None:
+                        end = min(end, bisect.bisect_left(entries, position))
+                    chunk = entries[max(start, end - RANGE_CHUNK):end]
+                    chunk.reverse()
+                else:
+                    if position is not None:
+                        start = max(start, bisect.bisect_right(
+                            entries, position + (_TOP,)))
+                    chunk = entries[start:min(end, start + RANGE_CHUNK)]
+            if len(chunk) == 0:
+                break
+            for entry in chunk:
+                yield entry[2]
+            position = chunk[-1][:2]
+
+        if low is not None or high is not None:
+            return
+        with self._lock:
+            missing = list(self.missing[attribute].values())
+        missing.sort(key=lambda obj: obj.id, reverse=reverse)
+        for obj in missing:
+            if after is not None and after[0] is None and (
+                    obj.id >= after[1] if reverse else obj.id <= after[1]):
+                continue
+            yield obj
 
 
 class Base():
     """ Base class
+
+    Subclasses list in `indexed_attributes` the attributes `search` should
+    answer from a hash index instead of a scan, and in `ordered_attributes`
+    the attributes `query` should filter by range and order from a sorted
+    index; indexes follow `save`, `remove` and `load_from_file`.
+
+    Subclasses declare their attributes in `__slots__` to store objects
+    without a per-object __dict__; subclasses that don't keep one.
+
+    Writes to a class are serialized by its `write_lock`; reads work on a
+    read-only copy of the store (`snapshot`), taken once per change, so
+    they never wait for writers.
+
+    With a storage backend (STORAGE), objects live in the backend instead
+    and the methods below delegate to it.
     """
 
+    __slots__ = ('id', 'created_at', 'updated_at')
+
+    indexed_attributes: Tuple[str, ...] = ()
+    ordered_attributes: Tuple[str, ...] = ('created_at', 'updated_at')
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
@@ -23,15 +369,14 @@ class Base():
         if DATA.get(s_class) is None:
             DATA[s_class] = {}
 
-        self.id = kwargs.get('id', str(uuid.uuid4()))
+        self.id = intern_string(kwargs['id'] if 'id' in kwargs
+                                else str(uuid.uuid4()))
         if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
+            self.created_at = parse_timestamp(kwargs.get('created_at'))
         else:
             self.created_at = datetime.utcnow()
         if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
+            self.updated_at = parse_timestamp(kwargs.get('updated_at'))
         else:
             self.updated_at = datetime.utcnow()
 
@@ -48,7 +393,11 @@ class Base():
         """ Convert the object a JSON dictionary
         """
         result = {}
-        for key, value in self.__dict__.items():
+        attributes = [(name, getattr(self, name))
+                      for name in _slot_names(type(self))
+                      if hasattr(self, name)]
+        attributes.extend(getattr(self, '__dict__', {}).items())
+        for key, value in attributes:
             if not for_serialization and key[0] == '_':
                 continue
             if type(value) is datetime:
@@ -57,56 +406,303 @@ class Base():
                 result[key] = value
         return result
 
+    def _json_entry(self) -> Tuple[datetime, bytes, str]:
+        """ Cached (updated_at, JSON bytes, ETag) of the object
+        """
+        if STORAGE is not None:
+            # Other processes write to the backend, which keeps updated_at
+            # to the second: only the content tells two versions apart
+            data = json.dumps(self.to_json(), sort_keys=True,
+                              separators=(',', ':')).encode()
+            return (self.updated_at, data, hashlib.sha1(data).hexdigest())
+        cache = JSON_CACHE.get(self.__class__.__name__)
+        if cache is None:
+            cache = JSON_CACHE.setdefault(self.__class__.__name__, {})
+        entry = cache.get(self.id)
+        if entry is not None and entry[0] == self.updated_at:
+            return entry
+        data = json.dumps(self.to_json(), sort_keys=True,
+                          separators=(',', ':')).encode()
+        etag = hashlib.sha1("{}\0{}".format(
+            self.id, self.updated_at.isoformat()).encode()).hexdigest()
+        entry = (self.updated_at, data, etag)
+        if len(cache) >= JSON_CACHE_SIZE:
+            # Drop the oldest entry; another thread may be changing the cache
+            try:
+                del cache[next(iter(cache))]
+            except (KeyError, RuntimeError, StopIteration):
+                pass
+        cache[self.id] = entry
+        return entry
+
+    def json_bytes(self) -> bytes:
+        """ to_json() serialized in UTF-8, cached until the object is
+            saved or removed (not cached with a storage backend)
+        """
+        return self._json_entry()[1]
+
+    def etag(self) -> str:
+        """ Strong entity tag of the object, from its id and updated_at,
+            or from its JSON with a storage backend
+        """
+        return self._json_entry()[2]
+
+    def _uncache(self):
+        """ Drop the cached JSON of the object
+        """
+        JSON_CACHE.get(self.__class__.__name__, {}).pop(self.id, None)
+
     @classmethod
     def load_from_file(cls):
         """ Load all objects from file
         """
+        JSON_CACHE.pop(cls.__name__, None)
+        if STORAGE is not None:
+            STORAGE.load(cls)
+            return
+        with cls.write_lock():
+            cls._load()
+            cls._changed()
+
+    @classmethod
+    def _load(cls):
+        """ Body of load_from_file; the caller holds the write lock
+        """
         s_class = cls.__name__
         file_path = ".db_{}.json".format(s_class)
         DATA[s_class] = {}
-        if not path.exists(file_path):
+        index = INDEXES[s_class] = AttributeIndex(cls.indexed_attributes,
+                                                  cls.ordered_attributes,
+                                                  DATA[s_class])
+        if SNAPSHOT_FORMAT == 'binary' and path.exists(cls._snapshot_path()):
+            DATA[s_class] = index.objects = LazyStore(
+                Snapshot(cls._snapshot_path()),
+                lambda obj_json: cls(**obj_json), index.add)
+        elif path.exists(file_path):
+            with open(file_path, 'r') as f:
+                objs_json = json.load(f)
+                for obj_id, obj_json in objs_json.items():
+                    obj = cls(**obj_json)
+                    DATA[s_class][intern_string(obj_id)] = obj
+                    index.add(obj)
+
+        if PERSISTENCE != 'journal':
             return
+        journal = cls.journal()
+        for record in journal.replay():
+            if record.get('op') == 'remove':
+                if DATA[s_class].pop(record['id'], None) is not None:
+                    index.discard(record['id'])
+            else:
+                obj = cls(**record['obj'])
+                DATA[s_class][obj.id] = obj
+                index.add(obj)
+        if path.exists(journal.compacting_path) or \
+                journal.records >= journal.compact_threshold:
+            journal.compact()
+
+    @classmethod
+    def write_lock(cls) -> threading.RLock:
+        """ Lock serializing the writes to the class
+        """
+        s_class = cls.__name__
+        lock = LOCKS.get(s_class)
+        if lock is None:
+            with _locks_lock:
+                lock = LOCKS.setdefault(s_class, threading.RLock())
+        return lock
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+    @classmethod
+    def _changed(cls):
+        """ Outdate the read snapshot; the caller holds the write lock
+        """
+        s_class = cls.__name__
+        VERSIONS[s_class] = VERSIONS.get(s_class, 0) + 1
+
+    @classmethod
+    def snapshot(cls) -> MappingProxyType:
+        """ Read-only {id: object} copy of the store, as of the last
+            write; copied at most once per write and shared by readers
+        """
+        s_class = cls.__name__
+        if STORAGE is not None:
+            return MappingProxyType({obj.id: obj
+                                     for obj in STORAGE.query(cls)})
+        version = VERSIONS.get(s_class, 0)
+        cached = SNAPSHOTS.get(s_class)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        # A plain dict copies in one step, without releasing the GIL
+        snapshot = MappingProxyType(DATA.get(s_class, {}).copy())
+        SNAPSHOTS[s_class] = (version, snapshot)
+        return snapshot
+
+    @classmethod
+    def journal(cls) -> Journal:
+        """ Append-only journal of the class
+        """
+        s_class = cls.__name__
+        if JOURNALS.get(s_class) is None:
+            writer = cls._write_snapshot \
+                if SNAPSHOT_FORMAT == 'binary' else None
+            JOURNALS[s_class] = Journal(s_class,
+                                        lambda: DATA.get(s_class, {}).copy(),
+                                        writer=writer)
+            atexit.register(JOURNALS[s_class].close)
+        return JOURNALS[s_class]
+
+    @classmethod
+    def index(cls) -> AttributeIndex:
+        """ Attribute index of the class
+        """
+        s_class = cls.__name__
+        if INDEXES.get(s_class) is None:
+            INDEXES[s_class] = AttributeIndex(cls.indexed_attributes,
+                                              cls.ordered_attributes,
+                                              DATA.setdefault(s_class, {}))
+            for obj in cls.snapshot().values():
+                INDEXES[s_class].add(obj)
+        return INDEXES[s_class]
+
+    @classmethod
+    def _snapshot_path(cls) -> str:
+        """ Path of the binary snapshot of the class
+        """
+        return ".db_{}.snap".format(cls.__name__)
+
+    @classmethod
+    def _write_snapshot(cls, objs: dict):
+        """ Write the binary snapshot of the given objects
+        """
+        objs_json = {obj_id: obj.to_json(True) for obj_id, obj in objs.items()}
+        write_snapshot(cls._snapshot_path(), objs_json, cls.indexed_attributes)
 
     @classmethod
     def save_to_file(cls):
         """ Save all objects to file
         """
+        if STORAGE is not None:
+            return
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        with cls.write_lock():
+            if SNAPSHOT_FORMAT == 'binary':
+                cls._write_snapshot(cls.snapshot())
+                return
+            file_path = ".db_{}.json".format(s_class)
+            objs_json = {}
+            for obj_id, obj in cls.snapshot().items():
+                objs_json[obj_id] = obj.to_json(True)
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+            # Readers of the file never see it half written
+            tmp_path = file_path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(objs_json, f)
+            os.replace(tmp_path, file_path)
+
+    @classmethod
+    def _file_changed(cls):
+        """ Write the class file now, or mark it dirty when writes are
+            deferred (write-behind or inside `batch`)
+        """
+        if WRITE_BEHIND_INTERVAL <= 0 and \
+                getattr(_batch_state, 'depth', 0) == 0:
+            cls.save_to_file()
+            return
+        with _dirty_lock:
+            DIRTY.add(cls)
+        if WRITE_BEHIND_INTERVAL > 0:
+            _start_flusher()
+
+    @staticmethod
+    def flush():
+        """ Write the file of every class changed since the last flush
+        """
+        with _dirty_lock:
+            classes = list(DIRTY)
+            DIRTY.clear()
+        for i, cls in enumerate(classes):
+            try:
+                cls.save_to_file()
+            except BaseException:
+                # Left for the next flush
+                with _dirty_lock:
+                    DIRTY.update(classes[i:])
+                raise
+
+    @staticmethod
+    @contextmanager
+    def batch():
+        """ Unit of work: defer file writes to the end of the block
+
+        Changes made in the block are written with one file write per
+        class when the outermost block exits, or one transaction of the
+        storage backend, rolled back if the block raises
+        """
+        if STORAGE is not None:
+            STORAGE.begin()
+        _batch_state.depth = getattr(_batch_state, 'depth', 0) + 1
+        try:
+            yield
+        except BaseException:
+            if STORAGE is not None:
+                STORAGE.rollback()
+            raise
+        else:
+            if STORAGE is not None:
+                STORAGE.commit()
+        finally:
+            _batch_state.depth -= 1
+            if STORAGE is None and _batch_state.depth == 0:
+                Base.flush()
 
     def save(self):
         """ Save current object
         """
         s_class = self.__class__.__name__
-        self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        self._uncache()
+        if STORAGE is not None:
+            self.updated_at = datetime.utcnow()
+            STORAGE.save(self)
+            return
+        with self.__class__.write_lock():
+            self.updated_at = datetime.utcnow()
+            DATA[s_class][self.id] = self
+            self.__class__.index().add(self)
+            self.__class__._changed()
+            if PERSISTENCE == 'journal':
+                self.__class__.journal().append({'op': 'save',
+                                                 'obj': self.to_json(True)})
+            else:
+                self.__class__._file_changed()
 
     def remove(self):
         """ Remove object
         """
         s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
+        self._uncache()
+        if STORAGE is not None:
+            STORAGE.remove(self)
+            return
+        with self.__class__.write_lock():
+            if DATA[s_class].get(self.id) is None:
+                return
             del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+            self.__class__.index().discard(self.id)
+            self.__class__._changed()
+            if PERSISTENCE == 'journal':
+                self.__class__.journal().append({'op': 'remove',
+                                                 'id': self.id})
+            else:
+                self.__class__._file_changed()
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
         s_class = cls.__name__
-        return len(DATA[s_class].keys())
+        if STORAGE is not None:
+            return STORAGE.count(cls)
+        return len(DATA[s_class])
 
     @classmethod
     def all(cls) -> Iterable[TypeVar('Base')]:
@@ -119,13 +715,20 @@ class Base():
         """ Return one object by ID
         """
         s_class = cls.__name__
+        if STORAGE is not None:
+            return STORAGE.get(cls, id)
         return DATA[s_class].get(id)
 
     @classmethod
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
+
+        Uses the index of the first indexed attribute, if any, to narrow the
+        candidates, and scans all objects otherwise
         """
         s_class = cls.__name__
+        if STORAGE is not None:
+            return STORAGE.search(cls, attributes)
         def _search(obj):
             if len(attributes) == 0:
                 return True
@@ -133,6 +736,131 @@ class Base():
                 if (getattr(obj, k) != v):
                     return False
             return True
-        
-        return list(filter(_search, DATA[s_class].values()))
 
+        candidates = None
+        for k, v in attributes.items():
+            candidates = cls.index().lookup(k, v)
+            if candidates is not None:
+                break
+        if candidates is None:
+            candidates = cls.snapshot().values()
+        return list(filter(_search, candidates))
+
+    @classmethod
+    def query(cls, filters: dict = None, order_by: str = None,
+              limit: int = None, offset: int = 0,
+              after: tuple = None) -> List[TypeVar('Base')]:
+        """ Search objects with filters, ordering and paging
+
+        `filters` maps an attribute to the value it must equal, or
+        `<attribute>__<op>` to a bound, op being gt, gte, lt or lte.
+        `order_by` is an attribute, prefixed with "-" for descending
+        order, ties being ordered by id; objects without a value come
+        last. `after`, a (value of order_by, id) pair, starts the results
+        past that position for keyset pagination. Candidates come from a
+        hash index, then a sorted index, before falling back to a scan
+        """
+        if after is not None and order_by is None:
+            raise ValueError("after needs order_by")
+        if STORAGE is not None:
+            return STORAGE.query(cls, filters, order_by, limit, offset,
+                                 after)
+        index = cls.index()
+        equal, bounds = split_filters(filters)
+
+        def _match(obj):
+            for k, v in equal.items():
+                if getattr(obj, k, None) != v:
+                    return False
+            for k, (low, include_low, high, include_high) in bounds.items():
+                value = getattr(obj, k, None)
+                if value is None:
+                    return False
+                try:
+                    if low is not None and (value < low or (
+                            value == low and not include_low)):
+                        return False
+                    if high is not None and (value > high or (
+                            value == high and not include_high)):
+                        return False
+                except TypeError:
+                    return False
+            return True
+
+        descending = order_by is not None and order_by.startswith('-')
+        order_by = order_by.lstrip('-') if order_by is not None else None
+
+        def _past(obj):
+            value = getattr(obj, order_by, None)
+            after_value, after_id = after
+            if after_value is None:
+                return value is None and (
+                    obj.id < after_id if descending else obj.id > after_id)
+            if value is None:
+                return True
+            if value != after_value:
+                return value < after_value if descending \
+                    else value > after_value
+            return obj.id < after_id if descending else obj.id > after_id
+
+        candidates = None
+        ordered = False
+        for k, v in equal.items():
+            candidates = index.lookup(k, v)
+            if candidates is not None:
+                break
+        if candidates is None and order_by is not None:
+            candidates = index.range(order_by,
+                                     *bounds.get(order_by, [None, True,
+                                                            None, True]),
+                                     reverse=descending, after=after)
+            ordered = candidates is not None
+        for k, bound in bounds.items():
+            if candidates is not None:
+                break
+            candidates = index.range(k, *bound)
+        if candidates is None:
+            candidates = cls.snapshot().values()
+
+        matches = filter(_match, candidates)
+        if order_by is not None and not ordered:
+            present = []
+            absent = []
+            for obj in matches:
+                if getattr(obj, order_by, None) is None:
+                    absent.append(obj)
+                else:
+                    present.append(obj)
+            present.sort(key=lambda obj: (getattr(obj, order_by), obj.id),
+                         reverse=descending)
+            absent.sort(key=lambda obj: obj.id, reverse=descending)
+            matches = present + absent
+            if after is not None:
+                matches = filter(_past, matches)
+        end = offset + limit if limit is not None else None
+        return list(islice(matches, offset, end))
+
+
+def _flush_periodically():
+    """ Body of the write-behind thread
+    """
+    while True:
+        time.sleep(WRITE_BEHIND_INTERVAL)
+        try:
+            Base.flush()
+        except Exception:
+            traceback.print_exc()
+
+
+def _start_flusher():
+    """ Start the write-behind thread once
+    """
+    global _flusher
+    if _flusher is not None:
+        return
+    with _dirty_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_periodically,
+                                        daemon=True)
+            _flusher.start()
+            atexit.register(Base.flush)
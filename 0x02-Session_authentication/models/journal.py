@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+""" Journal module
+
+Append-only persistence for the objects of one model class: every
+mutation appends one JSON line to `.db_<Class>.journal`, replayed over the
+`.db_<Class>.json` snapshot at load time. Once the journal grows past a
+threshold, a background thread folds it into a new snapshot.
+"""
+from os import getenv, path
+from typing import Callable, Iterator, Optional
+import json
+import os
+import shutil
+import threading
+import time
+import traceback
+
+
+FSYNC_POLICIES = ('always', 'interval', 'never')
+
+
+class Journal():
+    """ Append-only journal of one model class
+
+    fsync policy:
+      - always: fsync after every record
+      - interval: fsync at most once every `fsync_interval` seconds
+      - never: leave flushing to the operating system
+    """
+
+    def __init__(self, s_class: str, source: Callable[[], dict],
+                 fsync: str = None, fsync_interval: float = None,
+                 compact_threshold: int = None,
+                 writer: Optional[Callable[[dict], None]] = None):
+        """ Initialize the journal of a class
+
+        `source` returns a shallow copy of the {id: object} store, used to
+        write snapshots; `writer`, if given, writes them instead of the
+        JSON snapshot
+        """
+        self.snapshot_path = ".db_{}.json".format(s_class)
+        self.path = ".db_{}.journal".format(s_class)
+        self.compacting_path = self.path + ".compacting"
+        self.source = source
+        self.writer = writer
+        self.fsync = fsync or getenv('DB_JOURNAL_FSYNC', 'interval')
+        if self.fsync not in FSYNC_POLICIES:
+            raise ValueError("DB_JOURNAL_FSYNC must be one of {}"
+                             .format(", ".join(FSYNC_POLICIES)))
+        self.fsync_interval = fsync_interval if fsync_interval is not None \
+            else float(getenv('DB_JOURNAL_FSYNC_INTERVAL', '1'))
+        self.compact_threshold = compact_threshold or \
+            int(getenv('DB_JOURNAL_COMPACT_THRESHOLD', '10000'))
+        self.records = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._last_fsync = 0.0
+        self._compactor: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _read(file_path: str, repair: bool) -> Iterator[dict]:
+        """ Yield the records of a journal file
+
+        Reading stops at the first torn or corrupt record; with `repair`,
+        the file is truncated there so later appends start on a clean line
+        """
+        if not path.exists(file_path):
+            return
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        offset = 0
+        while offset < len(data):
+            end = data.find(b'\n', offset)
+            record = None
+            if end != -1:
+                try:
+                    record = json.loads(data[offset:end])
+                except ValueError:
+                    record = None
+            if record is None:
+                if repair:
+                    with open(file_path, 'r+b') as f:
+                        f.truncate(offset)
+                return
+            yield record
+            offset = end + 1
+
+    def replay(self) -> Iterator[dict]:
+        """ Yield every journaled record, oldest first
+
+        Includes the records of a compaction that did not finish
+        """
+        self.records = 0
+        for record in self._read(self.compacting_path, False):
+            yield record
+        for record in self._read(self.path, True):
+            self.records += 1
+            yield record
+
+    def append(self, record: dict):
+        """ Append one record, then compact in the background if needed
+        """
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a')
+            self._file.write(line)
+            self._file.flush()
+            now = time.monotonic()
+            if self.fsync == 'always' or (
+                    self.fsync == 'interval' and
+                    now - self._last_fsync >= self.fsync_interval):
+                os.fsync(self._file.fileno())
+                self._last_fsync = now
+            self.records += 1
+            if self.records >= self.compact_threshold and \
+                    self._compactor is None:
+                self._compactor = threading.Thread(target=self._compact,
+                                                   daemon=True)
+                self._compactor.start()
+
+    def _rotate(self) -> dict:
+        """ Move the journal aside and return the objects to snapshot;
+            the caller holds the lock
+        """
+        objs = self.source()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if path.exists(self.compacting_path):
+            self._fold_into_compacting()
+        elif path.exists(self.path):
+            os.replace(self.path, self.compacting_path)
+        self.records = 0
+        return objs
+
+    def _fold_into_compacting(self):
+        """ Append the journal to the records of an unfinished compaction,
+            which are not in the snapshot yet, instead of replacing them
+        """
+        if not path.exists(self.path):
+            return
+        with open(self.compacting_path, 'r+b') as f:
+            # Drop a torn last record, replay stops there anyway
+            data = f.read()
+            f.truncate(data.rfind(b'\n') + 1)
+            f.seek(0, os.SEEK_END)
+            with open(self.path, 'rb') as journal_file:
+                shutil.copyfileobj(journal_file, f)
+            f.flush()
+            if self.fsync != 'never':
+                os.fsync(f.fileno())
+        # A crash before this line replays the journal twice: every record
+        # sets the whole state of one object, so that is harmless
+        os.remove(self.path)
+
+    def _write_snapshot(self, objs: dict):
+        """ Atomically replace the snapshot, then drop the folded journal
+        """
+        if self.writer is not None:
+            self.writer(objs)
+            if path.exists(self.compacting_path):
+                os.remove(self.compacting_path)
+            return
+        objs_json = {obj_id: obj.to_json(True) for obj_id, obj in objs.items()}
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(objs_json, f)
+            f.flush()
+            if self.fsync != 'never':
+                os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        if path.exists(self.compacting_path):
+            os.remove(self.compacting_path)
+
+    def _compact(self):
+        """ Background compaction
+
+        Records appended while the snapshot is written go to a fresh
+        journal, replayed over the new snapshot at the next load
+        """
+        try:
+            with self._lock:
+                objs = self._rotate()
+            self._write_snapshot(objs)
+        except Exception:
+            # The folded records stay in the .compacting file, the next
+            # compaction appends to it, after compact_threshold new records
+            traceback.print_exc()
+        finally:
+            with self._lock:
+                self._compactor = None
+
+    def compact(self):
+        """ Fold the journal into the snapshot now
+        """
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+        with self._lock:
+            objs = self._rotate()
+            self._write_snapshot(objs)
+
+    def close(self):
+        """ Flush and close the journal file
+        """
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                if self.fsync != 'never':
+                    os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+""" Loader module
+
+Loads model classes from their files, either right away or in a
+background thread so the process can start serving before the stores are
+ready; callers that need the stores wait on `ready`.
+"""
+from typing import Dict, Iterable, Type
+from models.base import Base
+import threading
+import time
+
+
+class Loader():
+    """ Loads the stores of model classes once
+    """
+
+    def __init__(self, classes: Iterable[Type[Base]]):
+        """ Initialize the loader of the given classes
+        """
+        self.classes = tuple(classes)
+        self.ready = threading.Event()
+        # Set once loading ends, whether it succeeded or not
+        self.done = threading.Event()
+        self.states = {cls.__name__: 'pending' for cls in self.classes}
+        self.error = None
+        self._started = None
+        self._elapsed = None
+        self._thread = None
+
+    def load(self):
+        """ Load every class in the calling thread
+        """
+        self._started = time.monotonic()
+        try:
+            for cls in self.classes:
+                self.states[cls.__name__] = 'loading'
+                cls.load_from_file()
+                self.states[cls.__name__] = 'ready'
+        except Exception as e:
+            self.error = "{}: {}".format(type(e).__name__, e)
+            raise
+        else:
+            self.ready.set()
+        finally:
+            self._elapsed = time.monotonic() - self._started
+            self.done.set()
+
+    def start(self):
+        """ Load every class in a background thread
+        """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self.load, daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout: float = None) -> bool:
+        """ Wait until loading ends, True if every class is loaded
+        """
+        self.done.wait(timeout)
+        return self.ready.is_set()
+
+    def progress(self) -> Dict:
+        """ Loading state of every class, with the number of objects of
+            the loaded ones
+        """
+        elapsed = self._elapsed
+        if elapsed is None and self._started is not None:
+            elapsed = time.monotonic() - self._started
+        models = {}
+        for cls in self.classes:
+            state = self.states[cls.__name__]
+            models[cls.__name__] = {'state': state}
+            # A store is read whole before it is filled, so it is only
+            # counted once loaded
+            if state == 'ready':
+                models[cls.__name__]['objects'] = cls.count()
+        result = {'ready': self.ready.is_set(), 'models': models,
+                  'elapsed': round(elapsed or 0.0, 3)}
+        if self.error is not None:
+            result['error'] = self.error
+        return result
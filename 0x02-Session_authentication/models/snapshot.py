@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+""" Snapshot module
+
+Binary snapshot format for the objects of one model class, read through
+mmap so objects are only decoded when they are used.
+
+Layout (little endian):
+  - magic b"BSNAP001", uint32 number of tables
+  - per table: uint32 name length, name, uint64 table offset
+  - table: uint32 entry count, one uint64 offset per entry, then the
+    entries sorted by key; an entry is uint32 key length, uint32 value
+    length, key, value
+
+The table named "" maps id -> JSON record; the table named after an
+indexed attribute maps JSON-encoded value -> id (one entry per object).
+"""
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import json
+import mmap
+import os
+import struct
+import threading
+
+
+MAGIC = b"BSNAP001"
+_U32 = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+_ENTRY = struct.Struct("<II")
+
+
+def _table(entries: List[Tuple[bytes, bytes]]) -> bytes:
+    """ Encode sorted entries as a table
+    """
+    offsets = []
+    body = []
+    position = _U32.size + _U64.size * len(entries)
+    for key, value in entries:
+        offsets.append(_U64.pack(position))
+        body.append(_ENTRY.pack(len(key), len(value)) + key + value)
+        position += _ENTRY.size + len(key) + len(value)
+    return _U32.pack(len(entries)) + b"".join(offsets) + b"".join(body)
+
+
+def write_snapshot(file_path: str, objs_json: Dict[str, dict],
+                   attributes: Iterable[str] = ()):
+    """ Atomically write a binary snapshot of serialized objects
+    """
+    tables = {"": _table(sorted(
+        (obj_id.encode(), json.dumps(obj_json).encode())
+        for obj_id, obj_json in objs_json.items()))}
+    for attribute in attributes:
+        tables[attribute] = _table(sorted(
+            (json.dumps(obj_json.get(attribute)).encode(), obj_id.encode())
+            for obj_id, obj_json in objs_json.items()))
+
+    directory = []
+    size = len(MAGIC) + _U32.size + sum(
+        _U32.size + len(name.encode()) + _U64.size for name in tables)
+    for name, table in tables.items():
+        encoded = name.encode()
+        directory.append(_U32.pack(len(encoded)) + encoded + _U64.pack(size))
+        size += len(table)
+
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC + _U32.pack(len(tables)))
+        f.write(b"".join(directory))
+        for table in tables.values():
+            f.write(table)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+
+class Snapshot():
+    """ Memory-mapped reader of a binary snapshot
+    """
+
+    def __init__(self, file_path: str):
+        """ Map the file and read the table directory
+        """
+        with open(file_path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError("{} is not a binary snapshot".format(file_path))
+        position = len(MAGIC)
+        n_tables, = _U32.unpack_from(self._mm, position)
+        position += _U32.size
+        self._tables = {}
+        for _ in range(n_tables):
+            length, = _U32.unpack_from(self._mm, position)
+            position += _U32.size
+            name = self._mm[position:position + length].decode()
+            position += length
+            offset, = _U64.unpack_from(self._mm, position)
+            position += _U64.size
+            count, = _U32.unpack_from(self._mm, offset)
+            self._tables[name] = (offset, count)
+
+    @property
+    def count(self) -> int:
+        """ Number of objects in the snapshot
+        """
+        return self._tables[""][1]
+
+    def _header(self, table: str, i: int) -> Tuple[int, int, int]:
+        """ Position of the key, key length and value length of the
+            i-th entry of a table
+        """
+        offset, _ = self._tables[table]
+        position, = _U64.unpack_from(self._mm,
+                                     offset + _U32.size + _U64.size * i)
+        position += offset
+        key_length, value_length = _ENTRY.unpack_from(self._mm, position)
+        return position + _ENTRY.size, key_length, value_length
+
+    def _entry(self, table: str, i: int) -> Tuple[bytes, bytes]:
+        """ Key and value of the i-th entry of a table
+        """
+        position, key_length, value_length = self._header(table, i)
+        value = position + key_length
+        return self._mm[position:value], self._mm[value:value + value_length]
+
+    def _key(self, table: str, i: int) -> bytes:
+        """ Key of the i-th entry of a table
+        """
+        position, key_length, _ = self._header(table, i)
+        return self._mm[position:position + key_length]
+
+    def _find(self, table: str, key: bytes) -> int:
+        """ Index of the first entry whose key is >= key
+        """
+        low, high = 0, self._tables[table][1]
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(table, middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def get(self, obj_id: str) -> Optional[bytes]:
+        """ JSON record of an object, or None
+        """
+        key = obj_id.encode()
+        i = self._find("", key)
+        if i < self.count:
+            found, value = self._entry("", i)
+            if found == key:
+                return value
+        return None
+
+    def contains(self, obj_id: str) -> bool:
+        """ Whether the snapshot holds an object
+        """
+        key = obj_id.encode()
+        i = self._find("", key)
+        return i < self.count and self._key("", i) == key
+
+    def items(self) -> Iterator[Tuple[str, bytes]]:
+        """ Every (id, JSON record), by id
+        """
+        for i in range(self.count):
+            key, value = self._entry("", i)
+            yield key.decode(), value
+
+    def lookup(self, attribute: str, value) -> Optional[List[str]]:
+        """ Ids of the objects whose attribute was `value` when the
+            snapshot was written, or None if the attribute has no table
+        """
+        if attribute not in self._tables:
+            return None
+        try:
+            key = json.dumps(value).encode()
+        except (TypeError, ValueError):
+            return None
+        ids = []
+        i = self._find(attribute, key)
+        while i < self._tables[attribute][1]:
+            found, obj_id = self._entry(attribute, i)
+            if found != key:
+                break
+            ids.append(obj_id.decode())
+            i += 1
+        return ids
+
+
+_MISSING = object()
+
+
+class LazyStore(dict):
+    """ {id: object} store backed by a Snapshot
+
+    Objects are decoded from the snapshot on first access; iterating the
+    store decodes every remaining object once. Decoding and writes hold a
+    lock, so an object is never decoded twice
+    """
+
+    def __init__(self, snapshot: Snapshot, hydrate, on_hydrate=None):
+        """ Initialize the store
+
+        `hydrate` builds an object from its JSON record, `on_hydrate` is
+        called with every object decoded from the snapshot
+        """
+        super().__init__()
+        self.snapshot = snapshot
+        self.hydrate = hydrate
+        self.on_hydrate = on_hydrate
+        # Snapshot ids decoded, replaced or removed
+        self._settled = set()
+        self.complete = False
+        self._lock = threading.RLock()
+
+    def _pending(self, obj_id) -> bool:
+        """ Whether an id is only in the snapshot
+        """
+        return not self.complete and isinstance(obj_id, str) and \
+            obj_id not in self._settled and self.snapshot.contains(obj_id)
+
+    def _load(self, obj_id):
+        """ Decode an object from the snapshot, or return None
+        """
+        if self.complete or not isinstance(obj_id, str):
+            return None
+        with self._lock:
+            if dict.__contains__(self, obj_id):
+                return dict.__getitem__(self, obj_id)
+            if obj_id in self._settled:
+                return None
+            raw = self.snapshot.get(obj_id)
+            if raw is None:
+                return None
+            self._settled.add(obj_id)
+            obj = self.hydrate(json.loads(raw))
+            dict.__setitem__(self, obj_id, obj)
+            if self.on_hydrate is not None:
+                self.on_hydrate(obj)
+            return obj
+
+    def materialize(self):
+        """ Decode every object still only in the snapshot
+        """
+        if self.complete:
+            return
+        with self._lock:
+            if self.complete:
+                return
+            for obj_id, raw in self.snapshot.items():
+                if obj_id in self._settled:
+                    continue
+                obj = self.hydrate(json.loads(raw))
+                dict.__setitem__(self, obj_id, obj)
+                if self.on_hydrate is not None:
+                    self.on_hydrate(obj)
+            self.complete = True
+            self._settled = set()
+
+    def get(self, obj_id, default=None):
+        """ Object with the given id, hydrated if needed, or default
+        """
+        if dict.__contains__(self, obj_id):
+            return dict.__getitem__(self, obj_id)
+        obj = self._load(obj_id)
+        return default if obj is None else obj
+
+    def __getitem__(self, obj_id):
+        """ Object with the given id, KeyError if there is none
+        """
+        obj = self.get(obj_id, _MISSING)
+        if obj is _MISSING:
+            raise KeyError(obj_id)
+        return obj
+
+    def __contains__(self, obj_id) -> bool:
+        """ True if an object has the given id
+        """
+        return dict.__contains__(self, obj_id) or self._pending(obj_id)
+
+    def __setitem__(self, obj_id, obj):
+        """ Store an object, replacing its snapshot record
+        """
+        with self._lock:
+            if self._pending(obj_id):
+                self._settled.add(obj_id)
+            dict.__setitem__(self, obj_id, obj)
+
+    def __delitem__(self, obj_id):
+        """ Remove an object, hydrated or not
+        """
+        with self._lock:
+            pending = self._pending(obj_id)
+            if pending:
+                self._settled.add(obj_id)
+            if dict.__contains__(self, obj_id):
+                dict.__delitem__(self, obj_id)
+            elif not pending:
+                raise KeyError(obj_id)
+
+    def pop(self, obj_id, default=_MISSING):
+        """ Remove and return an object
+        """
+        with self._lock:
+            obj = self.get(obj_id, _MISSING)
+            if obj is _MISSING:
+                if default is _MISSING:
+                    raise KeyError(obj_id)
+                return default
+            dict.__delitem__(self, obj_id)
+            return obj
+
+    def __len__(self) -> int:
+        """ Number of objects, hydrated or not
+        """
+        if self.complete:
+            return dict.__len__(self)
+        return dict.__len__(self) + self.snapshot.count - len(self._settled)
+
+    def __iter__(self):
+        """ Iterate over the ids, once every object is hydrated
+        """
+        self.materialize()
+        return dict.__iter__(self)
+
+    def keys(self):
+        """ Ids, once every object is hydrated
+        """
+        self.materialize()
+        return dict.keys(self)
+
+    def values(self):
+        """ Objects, once every object is hydrated
+        """
+        self.materialize()
+        return dict.values(self)
+
+    def items(self):
+        """ (id, object) pairs, once every object is hydrated
+        """
+        self.materialize()
+        return dict.items(self)
+
+    def copy(self) -> dict:
+        """ Plain dict of every object
+        """
+        self.materialize()
+        return dict.copy(self)
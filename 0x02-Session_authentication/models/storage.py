@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+""" Storage module
+
+Storage backends of the model classes. By default `models.base.Base`
+keeps every class in process (DATA) and persists it to files; a backend
+selected with DB_STORAGE replaces that store for every class, so several
+worker processes can share one.
+"""
+from datetime import datetime
+from os import getenv
+from typing import Dict, Optional, Tuple
+import json
+import re
+import sqlite3
+import threading
+
+
+# Range operators of Base.query filters
+QUERY_OPERATORS = ('gt', 'gte', 'lt', 'lte')
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def split_filters(filters: dict) -> Tuple[Dict, Dict]:
+    """ Split Base.query filters into {attribute: value} equalities and
+        {attribute: [low, include_low, high, include_high]} bounds
+    """
+    equal = {}
+    bounds = {}
+    for key, value in (filters or {}).items():
+        attribute, _, op = key.partition('__')
+        if op == '':
+            equal[attribute] = value
+            continue
+        if op not in QUERY_OPERATORS:
+            raise ValueError("Unknown filter operator: {}".format(key))
+        bound = bounds.setdefault(attribute, [None, True, None, True])
+        if op in ('gt', 'gte'):
+            bound[0:2] = [value, op == 'gte']
+        else:
+            bound[2:4] = [value, op == 'lte']
+    return equal, bounds
+
+
+class Storage():
+    """ Interface of a storage backend
+
+    Methods take the model class, or the object, they work on
+    """
+
+    def load(self, cls):
+        """ Make the class ready to use (Base.load_from_file)
+        """
+        raise NotImplementedError
+
+    def save(self, obj):
+        """ Insert or replace an object
+        """
+        raise NotImplementedError
+
+    def remove(self, obj) -> bool:
+        """ Delete an object, True if it was stored
+        """
+        raise NotImplementedError
+
+    def get(self, cls, obj_id: str):
+        """ Object of the class with the given id, or None
+        """
+        raise NotImplementedError
+
+    def count(self, cls) -> int:
+        """ Number of objects of the class
+        """
+        raise NotImplementedError
+
+    def search(self, cls, attributes: dict) -> list:
+        """ Objects whose attributes equal the given values
+        """
+        return self.query(cls, attributes)
+
+    def query(self, cls, filters: dict = None, order_by: str = None,
+              limit: int = None, offset: int = 0,
+              after: tuple = None) -> list:
+        """ Objects matching Base.query filters, ordered and paged
+        """
+        raise NotImplementedError
+
+    def begin(self):
+        """ Start a unit of work in the calling thread (Base.batch)
+        """
+
+    def commit(self):
+        """ End the unit of work of the calling thread
+        """
+
+    def rollback(self):
+        """ End the unit of work of the calling thread, undoing its changes
+        """
+
+
+class SQLiteStorage(Storage):
+    """ Stores each class in an SQLite table
+
+    A row holds the object's JSON in `data`, plus one indexed column per
+    attribute in the class's indexed_attributes and ordered_attributes, so
+    lookups, ranges and ordering on them use the index. The database runs
+    in WAL mode so readers don't block the writer, and every thread uses
+    its own connection with a cache of prepared statements.
+    """
+
+    def __init__(self, database: str, timestamp_format: str,
+                 timeout: float = 30.0):
+        """ Initialize the storage of an SQLite database file
+        """
+        self.database = database
+        self.timestamp_format = timestamp_format
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # class name -> (columns, {statement name: SQL})
+        self._tables = {}
+
+    def connection(self) -> sqlite3.Connection:
+        """ Connection of the calling thread
+        """
+        db_connection = getattr(self._local, 'connection', None)
+        if db_connection is None:
+            # isolation_level=None: autocommit, except in begin()/commit()
+            db_connection = sqlite3.connect(
+                self.database, timeout=self.timeout, isolation_level=None,
+                check_same_thread=False, cached_statements=256)
+            db_connection.execute("PRAGMA journal_mode=WAL")
+            db_connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = db_connection
+            self._local.depth = 0
+        return db_connection
+
+    def _value(self, value):
+        """ Column value of an attribute value
+        """
+        if isinstance(value, datetime):
+            return value.strftime(self.timestamp_format)
+        if value is None or isinstance(value, (str, int, float)):
+            return value
+        return json.dumps(value)
+
+    def _table(self, cls) -> Tuple[Tuple[str, ...], Dict[str, str]]:
+        """ Columns and statements of the table of a class, creating or
+            extending the table on first use
+        """
+        s_class = cls.__name__
+        table = self._tables.get(s_class)
+        if table is not None:
+            return table
+        with self._lock:
+            if s_class in self._tables:
+                return self._tables[s_class]
+            columns = []
+            for attribute in ('created_at', 'updated_at') + \
+                    tuple(cls.indexed_attributes) + \
+                    tuple(cls.ordered_attributes):
+                if attribute not in columns and attribute != 'id':
+                    columns.append(attribute)
+            for name in [s_class] + columns:
+                if not _IDENTIFIER.match(name):
+                    raise ValueError("Invalid SQL identifier: {}".format(name))
+
+            db_connection = self.connection()
+            db_connection.execute(
+                'CREATE TABLE IF NOT EXISTS "{}" '
+                '(id TEXT PRIMARY KEY, data TEXT NOT NULL)'.format(s_class))
+            existing = {row[1] for row in db_connection.execute(
+                'PRAGMA table_info("{}")'.format(s_class))}
+            for column in columns:
+                if column in existing:
+                    continue
+                db_connection.execute('ALTER TABLE "{}" ADD COLUMN "{}"'
+                                      .format(s_class, column))
+                db_connection.execute(
+                    'UPDATE "{0}" SET "{1}" = json_extract(data, \'$.{1}\')'
+                    .format(s_class, column))
+            for column in columns:
+                # With the id, the index gives query's order and cursors
+                db_connection.execute('DROP INDEX IF EXISTS "ix_{}_{}"'
+                                      .format(s_class, column))
+                db_connection.execute(
+                    'CREATE INDEX IF NOT EXISTS "ix_{0}_{1}_id" '
+                    'ON "{0}"("{1}", id)'.format(s_class, column))
+
+            names = ", ".join('"{}"'.format(column) for column in columns)
+            statements = {
+                'save': 'INSERT OR REPLACE INTO "{}" (id, data, {}) '
+                        'VALUES (?, ?, {})'.format(
+                            s_class, names, ", ".join("?" * len(columns))),
+                'remove': 'DELETE FROM "{}" WHERE id = ?'.format(s_class),
+                'get': 'SELECT data FROM "{}" WHERE id = ?'.format(s_class),
+                'count': 'SELECT COUNT(*) FROM "{}"'.format(s_class),
+            }
+            table = self._tables[s_class] = (tuple(columns), statements)
+            return table
+
+    def _expression(self, cls, attribute: str) -> str:
+        """ SQL expression of an attribute: its column, or its value in
+            the JSON of the row
+        """
+        columns, _ = self._table(cls)
+        if attribute == 'id' or attribute in columns:
+            return '"{}"'.format(attribute)
+        if not _IDENTIFIER.match(attribute):
+            raise ValueError("Invalid attribute: {}".format(attribute))
+        return "json_extract(data, '$.{}')".format(attribute)
+
+    def load(self, cls):
+        """ Create or extend the table of the class
+        """
+        self._table(cls)
+
+    def save(self, obj):
+        """ Insert or replace the row of an object
+        """
+        columns, statements = self._table(type(obj))
+        obj_json = obj.to_json(True)
+        params = [obj.id, json.dumps(obj_json)]
+        params.extend(self._value(obj_json.get(column)) for column in columns)
+        self.connection().execute(statements['save'], params)
+
+    def remove(self, obj) -> bool:
+        """ Delete the row of an object, True if there was one
+        """
+        _, statements = self._table(type(obj))
+        cursor = self.connection().execute(statements['remove'], (obj.id,))
+        return cursor.rowcount > 0
+
+    def get(self, cls, obj_id: str):
+        """ Object of the class with the given id, or None
+        """
+        _, statements = self._table(cls)
+        row = self.connection().execute(statements['get'],
+                                        (obj_id,)).fetchone()
+        return cls(**json.loads(row[0])) if row is not None else None
+
+    def count(self, cls) -> int:
+        """ Number of rows of the class
+        """
+        _, statements = self._table(cls)
+        return self.connection().execute(statements['count']).fetchone()[0]
+
+    def query(self, cls, filters: dict = None, order_by: str = None,
+              limit: int = None, offset: int = 0,
+              after: tuple = None) -> list:
+        """ Objects matching Base.query filters
+        """
+        equal, bounds = split_filters(filters)
+        where = []
+        params = []
+        for attribute, value in equal.items():
+            expression = self._expression(cls, attribute)
+            if value is None:
+                where.append("{} IS NULL".format(expression))
+            else:
+                where.append("{} = ?".format(expression))
+                params.append(self._value(value))
+        for attribute, (low, include_low, high, include_high) in \
+                bounds.items():
+            expression = self._expression(cls, attribute)
+            where.append("{} IS NOT NULL".format(expression))
+            if low is not None:
+                where.append("{} {} ?".format(expression,
+                                              ">=" if include_low else ">"))
+                params.append(self._value(low))
+            if high is not None:
+                where.append("{} {} ?".format(expression,
+                                              "<=" if include_high else "<"))
+                params.append(self._value(high))
+
+        if order_by is None:
+            return self._select(cls, where, params, "", limit, offset)
+        attribute = order_by.lstrip('-')
+        expression = self._expression(cls, attribute)
+        direction = " DESC" if order_by.startswith('-') else ""
+        compare = "<" if direction else ">"
+        # Objects without a value come last in both directions. They are
+        # read by a second SELECT, so that both walk the (column, id) index
+        # from the cursor instead of sorting every remaining row
+        results = []
+        if after is None or after[0] is not None:
+            present = where + ["{} IS NOT NULL".format(expression)]
+            present_params = list(params)
+            if after is not None:
+                present.append("({}, id) {} (?, ?)".format(expression,
+                                                           compare))
+                present_params.extend([self._value(after[0]), after[1]])
+            results = self._select(
+                cls, present, present_params,
+                " ORDER BY {0}{1}, id{1}".format(expression, direction),
+                limit, offset)
+            if (limit is not None and len(results) >= limit) or \
+                    attribute in bounds:
+                return results
+            if offset > 0 and len(results) == 0:
+                offset = max(0, offset - self._count(cls, present,
+                                                     present_params))
+            else:
+                offset = 0
+        absent = where + ["{} IS NULL".format(expression)]
+        absent_params = list(params)
+        if after is not None and after[0] is None:
+            absent.append("id {} ?".format(compare))
+            absent_params.append(after[1])
+        results.extend(self._select(
+            cls, absent, absent_params, " ORDER BY id" + direction,
+            limit - len(results) if limit is not None else None, offset))
+        return results
+
+    def _select(self, cls, where: list, params: list, order: str,
+                limit: Optional[int], offset: int) -> list:
+        """ Objects of the rows matching every condition of `where`
+        """
+        sql = 'SELECT data FROM "{}"'.format(cls.__name__)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += order
+        if limit is not None or offset:
+            sql += " LIMIT ? OFFSET ?"
+            params = params + [limit if limit is not None else -1, offset]
+        rows = self.connection().execute(sql, params)
+        return [cls(**json.loads(row[0])) for row in rows]
+
+    def _count(self, cls, where: list, params: list) -> int:
+        """ Number of rows matching every condition of `where`
+        """
+        sql = 'SELECT COUNT(*) FROM "{}"'.format(cls.__name__)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        return self.connection().execute(sql, params).fetchone()[0]
+
+    def begin(self):
+        """ Start a transaction, or a savepoint within the current one
+        """
+        db_connection = self.connection()
+        depth = self._local.depth
+        if depth == 0:
+            db_connection.execute("BEGIN IMMEDIATE")
+        else:
+            db_connection.execute('SAVEPOINT "batch_{}"'.format(depth))
+        # Counted once started, so a failed BEGIN leaves nothing open
+        self._local.depth = depth + 1
+
+    def commit(self):
+        """ Commit the transaction, or release the current savepoint
+        """
+        db_connection = self.connection()
+        depth = self._local.depth = self._local.depth - 1
+        if depth > 0:
+            db_connection.execute('RELEASE "batch_{}"'.format(depth))
+            return
+        try:
+            db_connection.execute("COMMIT")
+        except sqlite3.Error:
+            if db_connection.in_transaction:
+                db_connection.execute("ROLLBACK")
+            raise
+
+    def rollback(self):
+        """ Roll back the transaction, or to the current savepoint
+        """
+        db_connection = self.connection()
+        depth = self._local.depth = self._local.depth - 1
+        if depth > 0:
+            db_connection.execute('ROLLBACK TO "batch_{}"'.format(depth))
+            db_connection.execute('RELEASE "batch_{}"'.format(depth))
+        elif db_connection.in_transaction:
+            db_connection.execute("ROLLBACK")
+
+
+def get_storage(timestamp_format: str) -> Optional[Storage]:
+    """ Storage backend selected by DB_STORAGE: "memory" (the default, no
+        backend: Base's own store) or "sqlite" (file DB_SQLITE_PATH)
+    """
+    kind = getenv('DB_STORAGE', 'memory')
+    if kind == 'memory':
+        return None
+    if kind == 'sqlite':
+        return SQLiteStorage(getenv('DB_SQLITE_PATH', '.db.sqlite3'),
+                             timestamp_format)
+    raise ValueError("DB_STORAGE must be memory or sqlite, not {}"
+                     .format(kind))
@@ -2,21 +2,27 @@
 """ User module
 """
 import hashlib
-from models.base import Base
+from models.base import Base, intern_string
 
 
 class User(Base):
     """ User class
     """
 
+    __slots__ = ('email', '_password', 'first_name', 'last_name')
+
+    indexed_attributes = ('email',)
+    ordered_attributes = ('created_at', 'updated_at', 'email', 'first_name',
+                          'last_name')
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a User instance
         """
         super().__init__(*args, **kwargs)
         self.email = kwargs.get('email')
         self._password = kwargs.get('_password')
-        self.first_name = kwargs.get('first_name')
-        self.last_name = kwargs.get('last_name')
+        self.first_name = intern_string(kwargs.get('first_name'))
+        self.last_name = intern_string(kwargs.get('last_name'))
 
     @property
     def password(self) -> str:
@@ -5,7 +5,7 @@ This module defines the UserSession class, which represents a user session
 in the system. The class provides attributes for user ID and session ID.
 """
 
-from models.base import Base
+from models.base import Base, intern_string
 
 
 class UserSession(Base):
@@ -15,6 +15,10 @@ class UserSession(Base):
     associated with a particular session.
     """
 
+    __slots__ = ('user_id', 'session_id')
+
+    indexed_attributes = ('session_id', 'user_id')
+
     def __init__(self, *args: list, **kwargs: dict):
         """Initializes a UserSession instance.
 
@@ -24,5 +28,5 @@ class UserSession(Base):
             'session_id', to initialize the user session.
         """
         super().__init__(*args, **kwargs)
-        self.user_id = kwargs.get('user_id')
+        self.user_id = intern_string(kwargs.get('user_id'))
         self.session_id = kwargs.get('session_id')